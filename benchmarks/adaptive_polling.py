@@ -0,0 +1,63 @@
+"""
+Benchmark of the polling of a job that waits in the queue behind another job
+and then runs, on a FakeQuantumMachine with a simulated clock: fixed-interval
+polling (an AdaptivePoller with min_interval = max_interval) versus the
+default AdaptivePoller. Reports the polls, the result handle RPCs
+(count_so_far and one fetch per tag) and the mean age of the fetched data.
+
+Run from the repository root with: PYTHONPATH=./qcore python benchmarks/adaptive_polling.py
+"""
+import contextlib
+import io
+import numpy as np
+
+from measurements.fake_qm import FakeQuantumMachine, SimulatedClock, \
+    SimulatedMeasurement, SweepModel
+from measurements.poller import AdaptivePoller
+
+SHOT_RATE = 1e5  # shots per second
+SWEEP_LENGTH = 100
+REPS = 20000  # 20 s of execution
+QUEUE_DELAY = 5.  # seconds of the job running before
+FIXED_INTERVALS = (0.01, 0.1)
+
+def run(**poller_options):
+    clock = SimulatedClock()
+    machine = FakeQuantumMachine(shot_rate=SHOT_RATE, seed=0, clock=clock)
+    machine.queue.add(SweepModel((SWEEP_LENGTH,),
+                                 int(QUEUE_DELAY * SHOT_RATE / SWEEP_LENGTH)))
+    model = SweepModel((SWEEP_LENGTH,), REPS)
+    measurement = SimulatedMeasurement('bench', machine, model)
+    with contextlib.redirect_stdout(io.StringIO()):
+        measurement.queue_job().status_ttl = 0.
+    poller = AdaptivePoller(measurement, clock=clock, sleep=clock.sleep,
+                            **poller_options)
+    poller.run()
+    assert measurement._fetched_count == REPS
+
+    # a poll of a running job asks count_so_far() and fetches every tag if
+    # there is new data, the age of fetched data is about half the interval
+    # since the previous poll
+    history = poller.history
+    running = [poll for poll in history if poll['status'] != 'queued']
+    fetching = [poll for poll in running if poll['rows']]
+    rpcs = len(running) + len(fetching) * len(model.result_tags)
+    ages = [(poll['time'] - previous['time']) / 2
+            for previous, poll in zip(history, history[1:]) if poll['rows']]
+    return len(history), rpcs, float(np.mean(ages)), poller.stats()
+
+def main():
+    print('%d reps x %d points at %g shots/s, %g s in queue'
+          % (REPS, SWEEP_LENGTH, SHOT_RATE, QUEUE_DELAY))
+    print('%-28s %8s %8s %12s' % ('', 'polls', 'RPCs', 'data age'))
+    for interval in FIXED_INTERVALS:
+        polls, rpcs, age, _ = run(min_interval=interval, max_interval=interval)
+        print('%-28s %8d %8d %9.1f ms' % ('fixed %g s' % interval, polls,
+                                          rpcs, age * 1e3))
+    polls, rpcs, age, stats = run()
+    print('%-28s %8d %8d %9.1f ms' % ('adaptive', polls, rpcs, age * 1e3))
+    print('%-28s %8.1f MB in %d polls' % ('fetched', stats['bytes'] / 1e6,
+                                           stats['polls'] - stats['empty_polls']))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+"""
+Benchmark of the parallel bulk export of run files (result.export).
+
+Builds a synthetic data directory of small run files (10k by default, in the
+"%Y%m%d/%H%M%S_name.hdf5" layout) and times export_tree serially and with a
+process pool, then times a second, up to date pass that skips every file.
+
+Run from the repository root with:
+    PYTHONPATH=./qcore python benchmarks/export_tree.py [n_files] [format]
+"""
+import os
+import sys
+import tempfile
+import time
+import h5py
+import numpy as np
+
+from result.export import export_tree
+from result.hdf5_register import write_dict_to_hdf5
+
+N_FILES = 10000
+FILES_PER_DAY = 1000
+
+def make_tree(datadir, n_files, rng):
+    for i in range(n_files):
+        folder = os.path.join(datadir, '202101%02d' % (1 + i // FILES_PER_DAY))
+        os.makedirs(folder, exist_ok=True)
+        filepath = os.path.join(folder, '%06d_T1.hdf5' % (i % FILES_PER_DAY))
+        with h5py.File(filepath, 'w') as f:
+            write_dict_to_hdf5({
+                'reps': 1000, 'wait_time': 20000,
+                'tau': np.arange(0, 200, 4),
+                'data': {'I_avg': rng.random(50), 'Q_avg': rng.random(50),
+                         'I': rng.random((200, 50)), 'Q': rng.random((200, 50))},
+                'fit': {'tau': 25.0 + rng.random(), 'amplitude': 1e-4}}, f)
+
+def timed_export(datadir, outdir, fmt, processes):
+    start = time.perf_counter()
+    summary = export_tree(datadir, outdir, fmt=fmt, processes=processes)
+    elapsed = time.perf_counter() - start
+    assert not summary['failed'], summary['failed'][:3]
+    return elapsed, summary
+
+def main():
+    n_files = int(sys.argv[1]) if len(sys.argv) > 1 else N_FILES
+    fmt = sys.argv[2] if len(sys.argv) > 2 else 'npz'
+    with tempfile.TemporaryDirectory() as tmpdir:
+        datadir = os.path.join(tmpdir, 'data')
+        start = time.perf_counter()
+        make_tree(datadir, n_files, np.random.default_rng(0))
+        print('created %d run files in %.1f s' % (n_files, time.perf_counter() - start))
+
+        for name, processes in (('serial', 1), ('process pool', None)):
+            outdir = os.path.join(tmpdir, 'export_' + name.replace(' ', '_'))
+            elapsed, summary = timed_export(datadir, outdir, fmt, processes)
+            print('%-13s %8.1f s  %8.0f files/s  (%d exported)' % (
+                name, elapsed, n_files / elapsed, len(summary['exported'])))
+        elapsed, summary = timed_export(datadir, outdir, fmt, None)
+        print('%-13s %8.1f s  (%d skipped)' % ('up to date', elapsed, len(summary['skipped'])))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+"""
+Benchmark of the DatasetFile storage profiles on single-shot I/Q data.
+
+Writes representative I and Q arrays (two readout blobs, values on the
+fixed point grid of the OPX) with every storage profile and reports write
+throughput and compression ratio, both for whole arrays written with
+write_dict and for streams appended batch by batch.
+
+Run from the repository root with: PYTHONPATH=./qcore python benchmarks/hdf5_compression.py
+"""
+import os
+import tempfile
+import time
+import numpy as np
+
+from result.hdf5_register import STORAGE_PROFILES, DatasetFile, hdf5plugin
+
+N_REPS = 20000
+SWEEP_LENGTH = 50
+BATCH = 500
+FIXED_POINT_STEP = 2.0 ** -28
+
+def make_iq(rng):
+    excited = rng.random((N_REPS, SWEEP_LENGTH)) < 0.5
+    I = rng.normal(1e-4, 2e-5, size=excited.shape) + 2e-4 * excited
+    Q = rng.normal(-1e-4, 2e-5, size=excited.shape) + 1e-4 * excited
+    return {'I': np.round(I / FIXED_POINT_STEP) * FIXED_POINT_STEP,
+            'Q': np.round(Q / FIXED_POINT_STEP) * FIXED_POINT_STEP}
+
+def write_whole(datadir, profile, data):
+    datafile = DatasetFile('whole_' + profile, datadir, timefilename=True, profile=profile)
+    datafile.write_dict({'data': data})
+    datafile.close()
+    return datafile.filepath
+
+def write_streamed(datadir, profile, data):
+    datafile = DatasetFile('stream_' + profile, datadir, timefilename=True, profile=profile)
+    for start in range(0, N_REPS, BATCH):
+        for tag, values in data.items():
+            datafile.append('data/' + tag, values[start:start + BATCH])
+    datafile.close()
+    return datafile.filepath
+
+def main():
+    data = make_iq(np.random.default_rng(0))
+    n_bytes = sum(values.nbytes for values in data.values())
+    print('I/Q: %d reps x %d points, %.1f MB raw, hdf5plugin %s' % (
+        N_REPS, SWEEP_LENGTH, n_bytes / 1e6,
+        'available' if hdf5plugin is not None else 'not available (fast = gzip 1)'))
+    with tempfile.TemporaryDirectory() as datadir:
+        for mode, write in (('whole', write_whole), ('stream', write_streamed)):
+            for profile in STORAGE_PROFILES:
+                start = time.perf_counter()
+                filepath = write(datadir, profile, data)
+                elapsed = time.perf_counter() - start
+                print('%-7s %-8s %8.1f MB/s   ratio %5.2f' % (
+                    mode, profile, n_bytes / elapsed / 1e6,
+                    n_bytes / os.path.getsize(filepath)))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+"""
+Benchmark of write_dict_to_hdf5 on a stage-like parameter snapshot.
+
+Compares write time and file size of the default writer with the bulk
+writer (packed scalars and dict tables), and checks that both round trip
+through read_dict_from_hdf5 to the same dict, also for an int outside the
+int64 range, which neither writer can store.
+
+Run from the repository root with: PYTHONPATH=./qcore python benchmarks/hdf5_snapshot_write.py
+"""
+import contextlib
+import io
+import logging
+import os
+import tempfile
+import time
+import h5py
+
+from result.hdf5_register import read_dict_from_hdf5, write_dict_to_hdf5
+
+N_INSTRUMENTS = 40
+N_PARAMETERS = 25
+N_REPEATS = 5
+
+def make_snapshot():
+    snapshot = {}
+    for i in range(N_INSTRUMENTS):
+        instrument = {}
+        for j in range(N_PARAMETERS):
+            instrument['float_par_%d' % j] = 1e9 + i * j * 0.5
+            instrument['int_par_%d' % j] = i * j
+        instrument['name'] = 'instrument_%d' % i
+        instrument['enabled'] = bool(i % 2)
+        instrument['operations'] = [{'name': 'op_%d' % k, 'length': 100 * k,
+                                     'amp': 0.1 * k} for k in range(10)]
+        snapshot['instrument_%d' % i] = instrument
+    # no native hdf5 type, skipped with a warning
+    snapshot['instrument_0']['serial_number'] = 2 ** 70
+    return snapshot
+
+@contextlib.contextmanager
+def silenced_warnings():
+    with contextlib.redirect_stdout(io.StringIO()):
+        logging.disable(logging.WARNING)
+        try:
+            yield
+        finally:
+            logging.disable(logging.NOTSET)
+
+def time_write(snapshot, filepath, bulk):
+    best = float('inf')
+    for _ in range(N_REPEATS):
+        start = time.perf_counter()
+        with h5py.File(filepath, 'w') as f:
+            write_dict_to_hdf5(snapshot, f, bulk=bulk)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def main():
+    snapshot = make_snapshot()
+    print('%d instruments x %d parameters' % (N_INSTRUMENTS, 2 * N_PARAMETERS + 3))
+    read_backs = []
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for bulk in (False, True):
+            filepath = os.path.join(tmpdir, 'snapshot_%s.hdf5' % bulk)
+            with silenced_warnings():
+                elapsed = time_write(snapshot, filepath, bulk)
+            with h5py.File(filepath, 'r') as f:
+                read_back = read_dict_from_hdf5({}, f)
+            assert read_back.keys() == snapshot.keys()
+            assert 'serial_number' not in read_back['instrument_0']
+            read_backs.append(read_back)
+            print('%-8s write %8.1f ms   size %8.1f kB' % (
+                'bulk' if bulk else 'default', elapsed * 1e3,
+                os.path.getsize(filepath) / 1e3))
+    assert read_backs[0] == read_backs[1]
+
+if __name__ == '__main__':
+    main()
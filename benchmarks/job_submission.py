@@ -0,0 +1,159 @@
+"""
+Benchmark of the per-job submission overhead of Measurement.queue_job.
+
+Queues a batch of jobs on a FakeQuantumMachine with a simulated clock, whose
+queue and job calls are made to take a fixed round trip to the QM server, and
+compares the old submission (fixed 3 s sleep plus status checks calling
+wait_for_execution) with the JobHandle based one, with the status cache and
+with it disabled (status_ttl = 0). The old sleep is not actually slept but
+added to the reported time. Then checks the JobHandle statuses against the
+fake QM: queued, in execution and cancelled, and result() with a timeout.
+
+Run from the repository root with: PYTHONPATH=./qcore python benchmarks/job_submission.py
+"""
+import contextlib
+import functools
+import io
+import time
+
+from measurements.fake_qm import FakeJob, FakeQuantumMachine, FakeQueue, \
+    FakeQueuedJob, SimulatedClock, SimulatedMeasurement, SweepModel
+
+N_JOBS = 20
+N_STATUS_CHECKS = 10  # status checks made by a script between submissions
+RPC_TIME = 0.002  # seconds, simulated round trip of a QM server call
+OLD_SLEEP = 3.0  # seconds, fixed sleep of the old queue_job
+SHOT_RATE = 1e5  # shots per second
+SWEEP_LENGTH = 100
+REPS = 100  # 0.1 s of execution per job
+QM_CALLS = {FakeQueue: ('add',),
+            FakeQueuedJob: ('position_in_queue', 'wait_for_execution',
+                            'cancel'),
+            FakeJob: ('is_paused', 'halt')}
+
+@contextlib.contextmanager
+def rpc_latency(calls):
+    """
+    Makes every QM call listed in QM_CALLS sleep RPC_TIME and count itself in
+    calls['count'].
+    """
+    originals = [(cls, name, getattr(cls, name))
+                 for cls, names in QM_CALLS.items() for name in names]
+
+    def remote(method):
+        @functools.wraps(method)
+        def call(*args, **kwargs):
+            calls['count'] += 1
+            time.sleep(RPC_TIME)
+            return method(*args, **kwargs)
+        return call
+
+    for cls, name, method in originals:
+        setattr(cls, name, remote(method))
+    try:
+        yield
+    finally:
+        for cls, name, method in originals:
+            setattr(cls, name, method)
+
+def new_measurement():
+    machine = FakeQuantumMachine(shot_rate=SHOT_RATE, seed=0,
+                                 clock=SimulatedClock())
+    return SimulatedMeasurement('bench', machine,
+                                SweepModel((SWEEP_LENGTH,), REPS))
+
+def submit_old(measurement):
+    """
+    Previous queue_job and _current_status, each status check calling
+    wait_for_execution. Returns the sleep time that would have been spent.
+    """
+    queued_job = measurement._quantum_machine.queue.add(measurement._script())
+    queued_job.position_in_queue()
+    queued_job.wait_for_execution()
+    for _ in range(N_STATUS_CHECKS):
+        queued_job.position_in_queue()
+        try:
+            queued_job.wait_for_execution().is_paused()
+        except RuntimeError:
+            pass  # concluded
+    return OLD_SLEEP
+
+def submit_handle(measurement, status_ttl = None):
+    handle = measurement.queue_job()
+    if status_ttl is not None:
+        handle.status_ttl = status_ttl
+    for _ in range(N_STATUS_CHECKS):
+        measurement._current_status()
+    return 0.0
+
+def check_statuses():
+    """
+    Follows a job queued behind another one through its statuses.
+    """
+    measurement = new_measurement()
+    machine = measurement._quantum_machine
+    clock = machine.clock
+    blocker = machine.queue.add(SweepModel((SWEEP_LENGTH,), REPS))
+    with contextlib.redirect_stdout(io.StringIO()):
+        handle = measurement.queue_job()
+    handle.status_ttl = 0.
+    assert handle.status() == 'queued' and handle.position() == 1
+    assert handle.job() is None
+    try:
+        handle.result(timeout=0.01)
+    except TimeoutError:
+        pass
+    else:
+        raise AssertionError('result() returned while the job was queued')
+
+    clock.sleep(blocker._job.duration())
+    assert handle.status() == 'in execution' and handle.position() is None
+    handle.cancel()
+    assert handle.status() == 'cancelled' and handle.done()
+    assert handle.job().halted
+    # a job that ran keeps its results
+    assert measurement._current_status() == 'concluded'
+
+    # cancelled while queued, the job never ran
+    with contextlib.redirect_stdout(io.StringIO()):
+        machine.queue.add(SweepModel((SWEEP_LENGTH,), REPS))
+        handle = measurement.queue_job()
+    handle.cancel()
+    assert handle.status() == 'cancelled' and handle.job() is None
+    assert machine.queue.count == 0
+    assert measurement._current_status() == 'not queued'
+
+    # result() waits for the job to conclude
+    with contextlib.redirect_stdout(io.StringIO()):
+        handle = measurement.queue_job()
+    clock.sleep(2 * REPS * SWEEP_LENGTH / SHOT_RATE)
+    result_handles = handle.result(timeout=1.)
+    assert handle.status() == 'concluded'
+    assert result_handles.get('I').count_so_far() == REPS
+
+def main():
+    cases = {
+        'sleep + wait_for_execution': submit_old,
+        'JobHandle': submit_handle,
+        'JobHandle, status_ttl = 0': functools.partial(submit_handle,
+                                                       status_ttl=0.),
+        }
+    print('%d jobs, %d status checks per job, %.0f ms per QM call'
+          % (N_JOBS, N_STATUS_CHECKS, RPC_TIME * 1e3))
+    for name, case in cases.items():
+        measurement = new_measurement()
+        calls = {'count': 0}
+        slept = 0.0
+        start = time.perf_counter()
+        with rpc_latency(calls), contextlib.redirect_stdout(io.StringIO()):
+            for _ in range(N_JOBS):
+                slept += case(measurement)
+        elapsed = time.perf_counter() - start + slept
+        print('%-28s %8.1f ms per job %6.1f QM calls per job'
+              % (name, elapsed / N_JOBS * 1e3, calls['count'] / N_JOBS))
+
+    check_statuses()
+    print('JobHandle statuses checked against the fake QM')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,314 @@
+"""
+End-to-end benchmark suite of the measurement pipeline.
+
+For every routine (PowerRabi, QubitT1, QubitT2, ResonatorSpectroscopy,
+QubitSpectroscopy) times the stages
+    program : QUA program construction with the routine's _script() (needs
+        the qm package, skipped otherwise)
+    polling@<rate> : Measurement.results() polled every POLL_INTERVAL until the
+        job concludes, on a FakeQuantumMachine acquiring <rate> shots per
+        second. The fake machine runs on a simulated clock, so only the host
+        time spent polling and accumulating is measured.
+    persistence : streaming the fetched batches to a DatasetFile and writing
+        the swept values of every axis and the final averages
+    fit : analysis.fit.do_fit of the final averages (needs lmfit)
+Only the program stage runs the routine classes, which import qm. The other
+stages run a fake_qm.SimulatedMeasurement queueing the routine_model of the
+routine, with its routine_grid: what differs between routines there is the
+sweep shape and repetitions (ROUTINES), the simulated signal and the fit
+function, while the polling, persistence and fit code is shared.
+
+For each stage the suite reports its time, its throughput, the peak of the
+memory allocated by python during the stage (tracemalloc, which does not see
+the allocations of C libraries such as hdf5), the net number of memory blocks
+it left allocated and the peak RSS of the process so far. Stages are timed
+(best of --repeat runs) without tracemalloc, which is enabled in a separate
+run for the memory figures.
+
+Results are saved as JSON with --save; --compare flags the stages that became
+slower than in a saved baseline by more than --tolerance.
+
+Run from the repository root with: PYTHONPATH=./qcore python benchmarks/pipeline.py
+    [--quick] [--save benchmarks/baselines/pipeline.json]
+    [--compare benchmarks/baselines/pipeline.json]
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+import numpy as np
+try:
+    import resource
+except ImportError:
+    # not available on Windows
+    resource = None
+
+from measurements.fake_qm import FakeQuantumMachine, SimulatedClock, \
+    SimulatedMeasurement, routine_grid, routine_model
+from result.hdf5_register import DatasetFile
+
+SHOT_RATES = (1e4, 1e5, 1e6)  # shots per second
+POLL_INTERVAL = 0.1  # simulated seconds between two polls
+DEFAULT_TOLERANCE = 0.3  # relative slow down reported as a regression
+MIN_SLOWDOWN = 0.005  # seconds, smaller slow downs are timing noise
+QUICK_FACTOR = 10  # --quick divides the repetitions by this
+DEFAULT_REPEAT = 3  # timed runs of every stage
+
+# Constructor arguments of every routine, the sweeps are the 'x' values of
+# the fits. Times in clock cycles, frequencies in Hz.
+TAUS = np.arange(4, 40004, 400)
+RR_FREQS = np.linspace(-60e6, -40e6, 201)
+QUBIT_FREQS = np.linspace(90e6, 130e6, 201)
+AMPLITUDES = np.linspace(-1.5, 1.5, 101)
+COMMON = {'wait_time': 50000, 'rr_f': -50e6, 'rr_ascale': 0.2,
+          'qubit_f': 110e6, 'qubit_ascale': 1.0, 'qubit_pulse': 'gaussian'}
+ROUTINES = {
+    'PowerRabi': dict(COMMON, reps=2000, qubit_ascale=AMPLITUDES),
+    'QubitT1': dict(COMMON, reps=2000, tau=TAUS),
+    'QubitT2': dict(COMMON, reps=2000, tau=TAUS),
+    'ResonatorSpectroscopy': {'reps': 500, 'wait_time': 50000,
+                              'rr_f': RR_FREQS, 'rr_ascale': [0.1, 0.2],
+                              'qubit_ascale': [0.0]},
+    'QubitSpectroscopy': dict(COMMON, reps=1000, qubit_f=QUBIT_FREQS,
+                              qubit_ascale=[0.5]),
+    }
+
+# Physical parameters of the simulated sample, fit function and (x, y) to fit
+# to the final averages, as a function of the averaged complex signal
+FITS = {
+    'PowerRabi': ({'pi_amplitude': 0.6}, 'sine', AMPLITUDES,
+                  lambda s: s.real),
+    'QubitT1': ({'t1': 8000}, 'exp_decay', TAUS, lambda s: s.real),
+    'QubitT2': ({'t2': 10000, 'detuning': 1 / 8000}, 'exp_decay_sine', TAUS,
+                lambda s: s.real),
+    'ResonatorSpectroscopy': ({'f0': -50e6, 'linewidth': 2e6}, 'lorentzian',
+                              RR_FREQS, lambda s: np.abs(s[0, 1])),
+    'QubitSpectroscopy': ({'f0': 110e6, 'linewidth': 4e6}, 'lorentzian',
+                          QUBIT_FREQS, lambda s: s[0].real),
+    }
+
+def peak_rss():
+    """
+    Peak resident set size of the process in bytes, None if unknown.
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+# ----------------------------------- Stages -----------------------------------
+
+def stage_program(routine, kwargs):
+    """
+    Builds the QUA program, returns the number of programs built.
+    """
+    module_names = {'PowerRabi': 'power_rabi', 'QubitT1': 'qubit_T1',
+                    'QubitT2': 'qubit_T2',
+                    'ResonatorSpectroscopy': 'resonator_spectroscopy',
+                    'QubitSpectroscopy': 'qubit_spectroscopy'}
+    module = __import__('measurements.routines.' + module_names[routine],
+                        fromlist=[routine])
+    measurement = getattr(module, routine)(routine, None, **kwargs)
+    measurement._script()
+    return 1
+
+def stage_polling(model, grid, shot_rate):
+    """
+    Polls a job until it concludes. Returns the number of shots fetched, the
+    fetched batch sizes and the final averaged signal.
+    """
+    clock = SimulatedClock()
+    machine = FakeQuantumMachine(shot_rate=shot_rate, seed=0, clock=clock)
+    measurement = SimulatedMeasurement('bench', machine, model, grid)
+    batches = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        handle = measurement.queue_job()
+        handle.status_ttl = 0.
+        while True:
+            clock.now += POLL_INTERVAL
+            previous = measurement._fetched_count
+            results = measurement.results()
+            if measurement._fetched_count > previous:
+                batches.append(measurement._fetched_count - previous)
+            if handle.done() and measurement._fetched_count == model.reps:
+                break
+    i_tag, q_tag, i_avg_tag, q_avg_tag = model.result_tags
+    signal = results[i_avg_tag][-1] + 1j * results[q_avg_tag][-1]
+    data = {tag: np.array(results[tag]) for tag in model.result_tags}
+    return model.reps * model.sweep_size, batches, signal, data
+
+def stage_persistence(datadir, data, batches, sweep):
+    """
+    Streams the results to a DatasetFile batch by batch. Returns the bytes written.
+    """
+    datafile = DatasetFile('bench', datadir, timefilename=True)
+    start = 0
+    for batch in batches:
+        for tag, values in data.items():
+            datafile.append(tag, values[start:start + batch])
+        start += batch
+    datafile.write_dict({'sweep': sweep,
+                         'averages': {tag: values[-1] for tag, values
+                                      in data.items() if tag.endswith('_avg')}})
+    datafile.close()
+    return sum(values.nbytes for values in data.values())
+
+def stage_fit(fit_func, xs, ys):
+    # imported here as lmfit is optional, see run_routine
+    from analysis.fit import do_fit
+    do_fit(fit_func, np.asarray(xs, dtype=float), np.asarray(ys, dtype=float))
+    return 1
+
+def measure(function, *args, repeat = 1):
+    """
+    Runs function repeat times untraced, keeping the best time, and once with
+    tracemalloc for its memory. Returns (its first result, a dict of metrics).
+    """
+    blocks = sys.getallocatedblocks()
+    start = time.perf_counter()
+    output = function(*args)
+    seconds = time.perf_counter() - start
+    net_blocks = sys.getallocatedblocks() - blocks
+    for _ in range(repeat - 1):
+        start = time.perf_counter()
+        function(*args)
+        seconds = min(seconds, time.perf_counter() - start)
+
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    function(*args)
+    peak_alloc = tracemalloc.get_traced_memory()[1] - baseline
+    tracemalloc.stop()
+    return output, {'seconds': seconds, 'peak_alloc_bytes': peak_alloc,
+                    'net_blocks': net_blocks, 'peak_rss_bytes': peak_rss()}
+
+def run_routine(routine, kwargs, datadir, quick = False, repeat = 1):
+    if quick:
+        kwargs = dict(kwargs, reps=max(kwargs['reps'] // QUICK_FACTOR, 1))
+    physics, fit_func, xs, to_ys = FITS[routine]
+    model = routine_model(routine, kwargs['reps'], kwargs, **physics)
+    grid = routine_grid(routine, kwargs)
+    stages = {}
+
+    try:
+        n, metrics = measure(stage_program, routine, kwargs,
+                             repeat=repeat)
+        stages['program'] = dict(metrics, throughput=n / metrics['seconds'],
+                                 unit='programs/s')
+    except ImportError as error:
+        stages['program'] = {'skipped': str(error)}
+
+    for shot_rate in SHOT_RATES:
+        (shots, batches, signal, data), metrics = measure(
+            stage_polling, model, grid, shot_rate, repeat=repeat)
+        stages['polling@%g' % shot_rate] = dict(
+            metrics, throughput=shots / metrics['seconds'], unit='shots/s',
+            polls=int(np.ceil(shots / shot_rate / POLL_INTERVAL)) + 1)
+
+    n_bytes, metrics = measure(stage_persistence, datadir, data, batches,
+                              grid.coords(), repeat=repeat)
+    stages['persistence'] = dict(metrics, unit='MB/s',
+                                 throughput=n_bytes / 1e6 / metrics['seconds'])
+
+    try:
+        # the first import loads every fit function, it is not timed
+        import analysis.fit
+        n, metrics = measure(stage_fit, fit_func, xs, to_ys(signal),
+                             repeat=repeat)
+        stages['fit'] = dict(metrics, throughput=n / metrics['seconds'],
+                             unit='fits/s')
+    except ImportError as error:
+        stages['fit'] = {'skipped': str(error)}
+    return stages
+
+# ---------------------------------- Reports -----------------------------------
+
+def print_report(results):
+    print('%-22s %-14s %10s %14s %12s %11s %10s' % (
+        'routine', 'stage', 'seconds', 'throughput', '', 'peak alloc',
+        'net blocks'))
+    for routine, stages in results['routines'].items():
+        for stage, metrics in stages.items():
+            if 'skipped' in metrics:
+                print('%-22s %-14s skipped (%s)' % (routine, stage,
+                                                    metrics['skipped']))
+                continue
+            print('%-22s %-14s %10.4f %14.4g %-12s %9.1fMB %10d' % (
+                routine, stage, metrics['seconds'], metrics['throughput'],
+                metrics['unit'], metrics['peak_alloc_bytes'] / 1e6,
+                metrics['net_blocks']))
+    if results['peak_rss_bytes'] is not None:
+        print('peak RSS %.1f MB' % (results['peak_rss_bytes'] / 1e6))
+
+def compare(results, baseline, tolerance):
+    """
+    Prints the stages slower than in baseline by more than tolerance.
+    Returns the number of regressions.
+    """
+    if baseline.get('quick') != results['quick']:
+        print('Warning: the baseline was run with quick=%s'
+              % baseline.get('quick'))
+    regressions = 0
+    for routine, stages in results['routines'].items():
+        for stage, metrics in stages.items():
+            reference = baseline['routines'].get(routine, {}).get(stage, {})
+            if 'seconds' not in metrics or 'seconds' not in reference:
+                continue
+            ratio = metrics['seconds'] / reference['seconds']
+            if ratio > 1 + tolerance \
+                    and metrics['seconds'] - reference['seconds'] > MIN_SLOWDOWN:
+                regressions += 1
+                print('REGRESSION %s %s: %.4f s vs %.4f s (x%.2f)' % (
+                    routine, stage, metrics['seconds'],
+                    reference['seconds'], ratio))
+    print('%d regression(s) against the baseline of %s' % (
+        regressions, baseline.get('date', 'unknown date')))
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--quick', action='store_true',
+                        help='divide the repetitions by %d' % QUICK_FACTOR)
+    parser.add_argument('--routines', nargs='+', default=list(ROUTINES),
+                        choices=list(ROUTINES))
+    parser.add_argument('--save', help='path of the JSON file to save to')
+    parser.add_argument('--compare', help='path of a JSON baseline')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE)
+    parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT,
+                        help='number of timed runs of every stage, the best '
+                             'time is reported')
+    args = parser.parse_args()
+
+    results = {'date': time.strftime('%Y-%m-%d %H:%M:%S'),
+               'python': platform.python_version(),
+               'numpy': np.__version__,
+               'machine': platform.platform(),
+               'quick': args.quick,
+               'repeat': args.repeat,
+               'routines': {}}
+    with tempfile.TemporaryDirectory() as datadir:
+        for routine in args.routines:
+            results['routines'][routine] = run_routine(
+                routine, ROUTINES[routine], datadir, args.quick, args.repeat)
+    results['peak_rss_bytes'] = peak_rss()
+    print_report(results)
+
+    regressions = 0
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+    if args.save:
+        os.makedirs(os.path.dirname(os.path.abspath(args.save)), exist_ok=True)
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=2)
+        print('Saved to %s' % args.save)
+    return 1 if regressions else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,49 @@
+"""
+Benchmark of result accumulation in Measurement.results.
+
+Polls a simulated stream of 10^6 shots 1000 times and compares the old
+np.append accumulation with ResultBuffer, with and without preallocation.
+
+Run from the repository root with: PYTHONPATH=./qcore python benchmarks/result_polling.py
+"""
+import time
+import numpy as np
+
+from measurements.result_buffer import ResultBuffer
+
+N_SHOTS = 10**6
+N_POLLS = 1000
+
+def poll_np_append(stream, n_polls):
+    results = np.array([])
+    for batch in np.array_split(stream, n_polls):
+        if results.size:
+            results = np.append(results, batch, axis = 0)
+        else:
+            results = batch
+    return results
+
+def poll_result_buffer(stream, n_polls, capacity = 0):
+    buffer = ResultBuffer(capacity=capacity)
+    for batch in np.array_split(stream, n_polls):
+        buffer.append(batch)
+    return buffer.data
+
+def main():
+    stream = np.random.normal(size=N_SHOTS)
+    cases = {
+        'np.append': lambda: poll_np_append(stream, N_POLLS),
+        'ResultBuffer (doubling)': lambda: poll_result_buffer(stream, N_POLLS),
+        'ResultBuffer (preallocated)':
+            lambda: poll_result_buffer(stream, N_POLLS, capacity=N_SHOTS),
+        }
+    print('%d shots, %d polls' % (N_SHOTS, N_POLLS))
+    for name, case in cases.items():
+        start = time.perf_counter()
+        results = case()
+        elapsed = time.perf_counter() - start
+        assert np.array_equal(results, stream)
+        print('%-28s %8.1f ms' % (name, elapsed * 1e3))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+"""
+Benchmark of MeasurementScheduler against serial execution of a calibration
+sequence (resonator spectroscopy -> qubit spectroscopy -> power rabi -> T1, T2),
+and of the same five measurements without dependencies.
+
+Runs in real time on a FakeQuantumMachine, which executes one job at a time,
+with the routine models of the fake QM standing in for the routines. Building
+a program and fitting the results take fixed times, and the shot rate makes
+every job execute for a fixed time. Reports the wall time and the duty cycle of
+the simulated hardware.
+
+Run from the repository root with: PYTHONPATH=./qcore python benchmarks/scheduler_pipeline.py
+"""
+import contextlib
+import io
+import time
+import numpy as np
+
+from measurements.fake_qm import FakeQuantumMachine, SimulatedMeasurement, \
+    routine_grid, routine_model
+from measurements.scheduler import MeasurementScheduler
+
+COMPILE_TIME = 0.3  # seconds to build a QUA program
+EXECUTION_TIME = 0.5  # seconds a job runs on the hardware
+FIT_TIME = 0.1  # seconds of analysis after a measurement
+N_POINTS = 1000
+REPS = 20
+SHOT_RATE = REPS * N_POINTS / EXECUTION_TIME
+SWEEPS = {
+    'ResonatorSpectroscopy': {'qubit_ascale': 0.1, 'rr_ascale': 0.1,
+                              'rr_f': np.linspace(-52e6, -48e6, N_POINTS)},
+    'QubitSpectroscopy': {'qubit_ascale': 0.1,
+                          'qubit_f': np.linspace(-60e6, -40e6, N_POINTS)},
+    'PowerRabi': {'qubit_ascale': np.linspace(0., 1.9, N_POINTS)},
+    'QubitT1': {'tau': np.arange(4, 4 * (N_POINTS + 1), 4)},
+    'QubitT2': {'tau': np.arange(4, 4 * (N_POINTS + 1), 4)},
+    }
+
+class CompiledMeasurement(SimulatedMeasurement):
+    """
+    SimulatedMeasurement taking COMPILE_TIME to build its program.
+    """
+    def _script(self):
+        time.sleep(COMPILE_TIME)
+        return super()._script()
+
+def fit(measurement):
+    time.sleep(FIT_TIME)
+
+def calibration_sequence(quantum_machine, dependent = True):
+    measurements = [CompiledMeasurement(routine, quantum_machine,
+                                        routine_model(routine, REPS, sweeps),
+                                        routine_grid(routine, sweeps))
+                    for routine, sweeps in SWEEPS.items()]
+    rr_spec, qubit_spec, rabi, t1, t2 = measurements
+    dependencies = {rr_spec: [], qubit_spec: [rr_spec], rabi: [qubit_spec],
+                    t1: [rabi], t2: [rabi]}
+    if not dependent:
+        dependencies = {measurement: [] for measurement in measurements}
+    return measurements, dependencies
+
+def run_serial(quantum_machine, dependent):
+    measurements, _ = calibration_sequence(quantum_machine, dependent)
+    for measurement in measurements:
+        measurement.queue_job()
+        measurement.job_handle.result()
+        measurement.results()
+        fit(measurement)
+    assert all(measurement._fetched_count == REPS
+               for measurement in measurements)
+
+def run_scheduler(quantum_machine, dependent):
+    measurements, dependencies = calibration_sequence(quantum_machine, dependent)
+    scheduler = MeasurementScheduler()
+    for measurement in measurements:
+        scheduler.add(measurement, dependencies[measurement], on_done=fit)
+    scheduler.run()
+    assert all(measurement._fetched_count == REPS
+               for measurement in measurements)
+    return scheduler
+
+def main():
+    print('compile %.1f s, execution %.1f s, fit %.1f s per measurement'
+          % (COMPILE_TIME, EXECUTION_TIME, FIT_TIME))
+    for dependent in (True, False):
+        print('with dependencies' if dependent else 'independent')
+        for name, run in (('serial', run_serial), ('scheduler', run_scheduler)):
+            quantum_machine = FakeQuantumMachine(shot_rate=SHOT_RATE,
+                                                 seed=0)
+            start = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                scheduler = run(quantum_machine, dependent)
+            elapsed = time.perf_counter() - start
+            print('  %-10s wall time %6.2f s, duty cycle %3.0f%%'
+                  % (name, elapsed,
+                     100 * quantum_machine.queue.busy_time() / elapsed))
+    scheduler.report()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,51 @@
+"""
+Benchmark of live single-shot statistics (means, variances and 2-D I/Q
+histograms per sweep point) during a run, computed with IQStats from every
+fetched batch versus recomputed from all shots accumulated so far at every
+poll.
+
+Run from the repository root with: PYTHONPATH=./qcore python benchmarks/streaming_stats.py
+"""
+import time
+import numpy as np
+
+from measurements.reducers import IQStats
+
+N_REPS = 20000
+SWEEP_LENGTH = 50
+N_POLLS = 100
+BINS = 50
+IQ_RANGE = ((-3., 3.), (-3., 3.))
+
+def recompute(i_all, q_all):
+    i_all.mean(axis=0), i_all.var(axis=0, ddof=1)
+    q_all.mean(axis=0), q_all.var(axis=0, ddof=1)
+    for point in range(i_all.shape[1]):
+        np.histogram2d(i_all[:, point], q_all[:, point], bins=BINS,
+                       range=IQ_RANGE)
+
+def main():
+    rng = np.random.default_rng(0)
+    i_shots = rng.normal(size=(N_REPS, SWEEP_LENGTH))
+    q_shots = rng.normal(size=(N_REPS, SWEEP_LENGTH))
+    bounds = np.linspace(0, N_REPS, N_POLLS + 1).astype(int)
+    print('%d reps x %d points, %d polls, %d x %d bins'
+          % (N_REPS, SWEEP_LENGTH, N_POLLS, BINS, BINS))
+
+    stats = IQStats(bins=BINS, iq_range=IQ_RANGE)
+    start = time.perf_counter()
+    for a, b in zip(bounds[:-1], bounds[1:]):
+        stats.update({'I': i_shots[a:b], 'Q': q_shots[a:b]})
+    streaming = time.perf_counter() - start
+    assert np.allclose(stats.i.variance(), i_shots.var(axis=0, ddof=1))
+
+    start = time.perf_counter()
+    for b in bounds[1:]:
+        recompute(i_shots[:b], q_shots[:b])
+    full = time.perf_counter() - start
+
+    print('%-28s %8.1f ms per poll' % ('recomputed every poll', full / N_POLLS * 1e3))
+    print('%-28s %8.1f ms per poll' % ('IQStats', streaming / N_POLLS * 1e3))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+"""
+Benchmark of the preparation of the QUA sweep arrays of a resonator
+spectroscopy, as previously done in ResonatorSpectroscopy._script (meshgrid,
+flatten and a python int() per point) and with SweepGrid.
+
+Run from the repository root with: PYTHONPATH=./qcore python benchmarks/sweep_grid.py
+"""
+import time
+import numpy as np
+
+from measurements.sweep_grid import SweepGrid
+
+QUBIT_ASCALES = np.linspace(0, 1, 5)
+RR_ASCALES = np.linspace(0.05, 0.5, 10)
+RR_FREQS = np.linspace(-60e6, -40e6, 20001)
+N_RUNS = 5
+
+def old_arrays():
+    parameter_list = [(x.flatten())
+                      for x in np.meshgrid(QUBIT_ASCALES, RR_ASCALES, RR_FREQS,
+                                           indexing = 'ij')]
+    qu_a_vec_py = parameter_list[0]
+    rr_a_vec_py = parameter_list[1]
+    rr_f_vec_py = [int(x) for x in parameter_list[2]]
+    return qu_a_vec_py, rr_a_vec_py, rr_f_vec_py
+
+def grid_arrays():
+    grid = SweepGrid([('qubit_ascale', QUBIT_ASCALES),
+                      ('rr_ascale', RR_ASCALES),
+                      ('rr_f', RR_FREQS, int)])
+    return (grid.qua_array('qubit_ascale'), grid.qua_array('rr_ascale'),
+            grid.qua_array('rr_f'))
+
+def best_time(function):
+    best = float('inf')
+    for _ in range(N_RUNS):
+        start = time.perf_counter()
+        output = function()
+        best = min(best, time.perf_counter() - start)
+    return best, output
+
+def main():
+    shape = (len(QUBIT_ASCALES), len(RR_ASCALES), len(RR_FREQS))
+    print('grid %s, %d points' % (shape, np.prod(shape)))
+    old_time, old = best_time(old_arrays)
+    grid_time, new = best_time(grid_arrays)
+    assert all(list(a) == list(b) for a, b in zip(old, new))
+    print('%-28s %8.1f ms' % ('meshgrid + int()', old_time * 1e3))
+    print('%-28s %8.1f ms' % ('SweepGrid', grid_time * 1e3))
+
+    grid = SweepGrid([('qubit_ascale', QUBIT_ASCALES),
+                      ('rr_ascale', RR_ASCALES), ('rr_f', RR_FREQS, int)])
+    stream = np.random.normal(size=10 * grid.size)
+    reshape_time, _ = best_time(lambda: grid.reshape(stream))
+    print('%-28s %8.3f ms' % ('reshape of 10 sweeps', reshape_time * 1e3))
+
+if __name__ == '__main__':
+    main()
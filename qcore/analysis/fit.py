@@ -27,7 +27,7 @@ del name, mod, func, guess
 def eval_fit(fit_func, params, xs, ys=None):
     if isinstance(fit_func, str):
         fit_func = FIT_FUNCS[fit_func][0]
-    func_args = inspect.getargspec(fit_func)[0]
+    func_args = inspect.getfullargspec(fit_func)[0]
     kwargs = {k: p.value for k, p in params.items()}
     kwargs['params'] = params
     kwargs['xs'] = xs
@@ -0,0 +1,636 @@
+"""
+In-process simulation of a QM server, for offline tests and throughput
+benchmarks.
+
+FakeQuantumMachine has the surfaces used by Measurement, the routines and
+MixerTuner: queue.add() returning a queued job with id(), position_in_queue(),
+wait_for_execution() and cancel(), jobs with is_paused(), halt() and
+result_handles.get(tag).count_so_far() / fetch(slice, flat_struct=True), and
+execute(), set_output_dc_offset_by_element(), set_mixer_correction(),
+get_config() and close(). FakeQuantumMachinesManager().open_qm(config)
+returns one.
+
+Jobs run one at a time in queue order. A job acquires shot_rate shots (single
+sweep points) per second, so a repetition of the sweep completes every
+sweep_size / shot_rate seconds, and results are generated lazily when they are
+fetched. What a job measures is given by a SweepModel: every repetition yields
+the model signal at all sweep points plus gaussian noise, saved like the
+routines do under 'I', 'Q' (single repetitions) and 'I_avg', 'Q_avg' (running
+averages). queue.add() takes either a SweepModel or any program (e.g. a QUA
+program) together with a model set as FakeQuantumMachine.model. simulate()
+makes a routine queue its model (see model_for) instead of its QUA program.
+The routine modules import the qm package, so without it a
+SimulatedMeasurement queueing a routine_model stands in for the routine. A
+SimulatedClock makes the machine run in simulated time.
+"""
+import copy
+import itertools
+import time
+import numpy as np
+
+from measurements.measurement import Measurement
+from measurements.result_buffer import ResultBuffer
+from measurements.sweep_grid import SweepGrid
+from parameter import Parameter
+
+DEFAULT_SHOT_RATE = 1e4  # shots per second
+RESULT_TAGS = ('I', 'Q', 'I_avg', 'Q_avg')
+
+# ----------------------------------- Models -----------------------------------
+
+class SweepModel:
+    """
+    Synthetic I/Q of a measurement repeating a sweep reps times.
+
+    Subclasses define the complex signal at every sweep point, the base class
+    measures a constant 0.
+    """
+    def __init__(self, sweep_shape: tuple, reps: int, noise: float = 0.05,
+                 result_tags: tuple = RESULT_TAGS):
+        """
+        Arguments:
+            sweep_shape (tuple) : shape of the buffer saved per repetition
+            reps (int) : number of repetitions of the sweep
+            noise (float) : standard deviation of the gaussian noise on I and Q
+            result_tags (tuple) : tags of the single shot I and Q and of their
+                running averages
+        """
+        self.sweep_shape = tuple(sweep_shape)
+        self.reps = int(reps)
+        self.noise = noise
+        self.result_tags = tuple(result_tags)
+
+    @property
+    def sweep_size(self):
+        return int(np.prod(self.sweep_shape))
+
+    def signal(self):
+        """
+        Returns the noiseless complex I + iQ at every sweep point.
+        """
+        return np.zeros(self.sweep_shape, dtype=complex)
+
+class QubitModel(SweepModel):
+    """
+    Sweep measuring the excited state population of a qubit, the readout
+    giving iq_ground and iq_excited for the two qubit states.
+    """
+    def __init__(self, sweep_shape: tuple, reps: int,
+                 iq_ground: complex = 1. + 0.j, iq_excited: complex = -.6 + .8j,
+                 **kwargs):
+        super().__init__(sweep_shape, reps, **kwargs)
+        self.iq_ground = iq_ground
+        self.iq_excited = iq_excited
+
+    def population(self):
+        return np.zeros(self.sweep_shape)
+
+    def signal(self):
+        population = self.population()
+        return (1 - population) * self.iq_ground + population * self.iq_excited
+
+class LorentzianResonance(SweepModel):
+    """
+    Transmission through a resonator (notch at f0) swept along the last axis.
+    """
+    def __init__(self, frequencies, f0: float, linewidth: float, reps: int,
+                 sweep_shape: tuple = None, depth: float = .8, **kwargs):
+        frequencies = np.asarray(frequencies, dtype=float)
+        if sweep_shape is None:
+            sweep_shape = frequencies.shape
+        super().__init__(sweep_shape, reps, **kwargs)
+        self.frequencies = frequencies
+        self.f0 = f0
+        self.linewidth = linewidth
+        self.depth = depth
+
+    def signal(self):
+        half_width = self.linewidth / 2
+        s21 = 1 - self.depth * half_width \
+              / (half_width + 1j * (self.frequencies - self.f0))
+        return np.broadcast_to(s21, self.sweep_shape)
+
+class QubitSpectroscopy(QubitModel):
+    """
+    Lorentzian excitation of a qubit at f0, swept along the last axis.
+    """
+    def __init__(self, frequencies, f0: float, linewidth: float, reps: int,
+                 sweep_shape: tuple = None, contrast: float = .5, **kwargs):
+        frequencies = np.asarray(frequencies, dtype=float)
+        if sweep_shape is None:
+            sweep_shape = frequencies.shape
+        super().__init__(sweep_shape, reps, **kwargs)
+        self.frequencies = frequencies
+        self.f0 = f0
+        self.linewidth = linewidth
+        self.contrast = contrast
+
+    def population(self):
+        detuning = 2 * (self.frequencies - self.f0) / self.linewidth
+        return np.broadcast_to(self.contrast / (1 + detuning ** 2),
+                               self.sweep_shape)
+
+class RabiOscillation(QubitModel):
+    """
+    Rabi oscillation versus the amplitude of the qubit pulse.
+    """
+    def __init__(self, amplitudes, pi_amplitude: float, reps: int, **kwargs):
+        self.amplitudes = np.asarray(amplitudes, dtype=float)
+        super().__init__(self.amplitudes.shape, reps, **kwargs)
+        self.pi_amplitude = pi_amplitude
+
+    def population(self):
+        return np.sin(np.pi / 2 * self.amplitudes / self.pi_amplitude) ** 2
+
+class T1Decay(QubitModel):
+    """
+    Exponential decay of the excited state after a pi pulse.
+    """
+    def __init__(self, taus, t1: float, reps: int, **kwargs):
+        self.taus = np.asarray(taus, dtype=float)
+        super().__init__(self.taus.shape, reps, **kwargs)
+        self.t1 = t1
+
+    def population(self):
+        return np.exp(-self.taus / self.t1)
+
+class RamseyDecay(QubitModel):
+    """
+    Decaying Ramsey fringes between two pi/2 pulses, detuning in inverse units
+    of taus.
+    """
+    def __init__(self, taus, t2: float, reps: int, detuning: float = 0.,
+                 **kwargs):
+        self.taus = np.asarray(taus, dtype=float)
+        super().__init__(self.taus.shape, reps, **kwargs)
+        self.t2 = t2
+        self.detuning = detuning
+
+    def population(self):
+        return .5 * (1 - np.exp(-self.taus / self.t2)
+                     * np.cos(2 * np.pi * self.detuning * self.taus))
+
+# Constructor arguments of the routines setting the sweep of their model, from
+# the outer to the inner loop
+ROUTINE_SWEEPS = {
+    'ResonatorSpectroscopy': ('qubit_ascale', 'rr_ascale', 'rr_f'),
+    'QubitSpectroscopy': ('qubit_ascale', 'qubit_f'),
+    'QubitFSpectroscopy': ('qubit_ascale', 'qubit_f'),
+    'PowerRabi': ('qubit_ascale',),
+    'QubitT1': ('tau',),
+    'QubitT2': ('tau',),
+    }
+# Swept constructor arguments the routines declare as QUA ints
+INT_SWEEPS = ('rr_f', 'qubit_f', 'tau')
+
+def _values(value):
+    return np.atleast_1d(np.asarray(value, dtype=float))
+
+def _span(values):
+    return (values.max() - values.min()) or 1.
+
+def routine_model(routine: str, reps: int, sweeps: dict,
+                  **physics) -> SweepModel:
+    """
+    Returns the model of what the routine of class name routine measures.
+
+    Arguments:
+        routine (str) : class name of the routine, a key of ROUTINE_SWEEPS
+        reps (int) : number of repetitions
+        sweeps (dict) : value of every constructor argument of the routine in
+            ROUTINE_SWEEPS[routine], other items are ignored
+        physics : physical parameters (f0, linewidth, pi_amplitude, t1, t2,
+            ...) and other model arguments (noise, iq_ground...). By default
+            the feature is in the middle of the sweep.
+    """
+    if routine not in ROUTINE_SWEEPS:
+        raise ValueError('No model for measurements of type %s.' % routine)
+    if routine == 'ResonatorSpectroscopy':
+        freqs = _values(sweeps['rr_f'])
+        shape = (len(_values(sweeps['qubit_ascale'])),
+                 len(_values(sweeps['rr_ascale'])), len(freqs))
+        physics = dict({'f0': freqs.mean(), 'linewidth': _span(freqs) / 10},
+                       **physics)
+        return LorentzianResonance(freqs, reps=reps, sweep_shape=shape,
+                                   **physics)
+    if routine in ('QubitSpectroscopy', 'QubitFSpectroscopy'):
+        freqs = _values(sweeps['qubit_f'])
+        shape = (len(_values(sweeps['qubit_ascale'])), len(freqs))
+        physics = dict({'f0': freqs.mean(), 'linewidth': _span(freqs) / 10},
+                       **physics)
+        return QubitSpectroscopy(freqs, reps=reps, sweep_shape=shape,
+                                 **physics)
+    if routine == 'PowerRabi':
+        amplitudes = _values(sweeps['qubit_ascale'])
+        physics = dict({'pi_amplitude': np.abs(amplitudes).max() / 2},
+                       **physics)
+        return RabiOscillation(amplitudes, reps=reps, **physics)
+    taus = _values(sweeps['tau'])
+    if routine == 'QubitT1':
+        physics = dict({'t1': taus.max() / 3}, **physics)
+        return T1Decay(taus, reps=reps, **physics)
+    physics = dict({'t2': taus.max() / 3}, **physics)
+    return RamseyDecay(taus, reps=reps, **physics)
+
+def routine_grid(routine: str, sweeps: dict) -> SweepGrid:
+    """
+    Returns the SweepGrid the routine of class name routine builds in its
+    _script() for the sweeps of routine_model.
+    """
+    if routine not in ROUTINE_SWEEPS:
+        raise ValueError('No sweep for measurements of type %s.' % routine)
+    return SweepGrid([(name, sweeps[name], int) if name in INT_SWEEPS
+                      else (name, sweeps[name])
+                      for name in ROUTINE_SWEEPS[routine]])
+
+def model_for(measurement, **physics) -> SweepModel:
+    """
+    Returns the model of what the routine measurement (an instance of one of
+    the classes in measurements.routines) measures, with the sweep of its
+    parameters, see routine_model.
+    """
+    routine = type(measurement).__name__
+    if routine not in ROUTINE_SWEEPS:
+        raise ValueError('No model for measurements of type %s.' % routine)
+    sweeps = {name: getattr(measurement, '_' + name).value
+              for name in ROUTINE_SWEEPS[routine]}
+    return routine_model(routine, measurement._reps.value, sweeps, **physics)
+
+def simulate(measurement, model: SweepModel = None, **physics):
+    """
+    Makes measurement queue model (by default model_for(measurement,
+    **physics)) instead of building its QUA program, so a routine runs on a
+    FakeQuantumMachine. Returns measurement.
+    """
+    def _script():
+        sweep_model = model if model is not None \
+                      else model_for(measurement, **physics)
+        measurement._result_tags = list(sweep_model.result_tags)
+        return sweep_model
+    measurement._script = _script
+    return measurement
+
+class SimulatedMeasurement(Measurement):
+    """
+    Measurement queueing a SweepModel, e.g. a routine_model standing in for a
+    routine where the qm package is not installed. Its repetitions parameter
+    sets the repetitions of the queued model, e.g. to resume() a checkpoint.
+    """
+    def __init__(self, name: str, quantum_machine, model: SweepModel,
+                 sweep_grid: SweepGrid = None, **measurement_options):
+        """
+        Arguments:
+            model (SweepModel) : model of the queued jobs
+            sweep_grid (SweepGrid) : grid the fetched results are reshaped
+                with, e.g. the routine_grid of the routine stood in for
+            measurement_options : other arguments of Measurement (sink...)
+        """
+        super().__init__(name, quantum_machine, **measurement_options)
+        self.model = model
+        self._sweep_grid = sweep_grid
+        self._reps = Parameter('Repetitions', model.reps)
+        self._result_tags = list(model.result_tags)
+
+    def _create_parameters(self):
+        pass
+
+    def _setup(self):
+        pass
+
+    def _script(self):
+        if int(self._reps.value) == self.model.reps:
+            return self.model
+        model = copy.copy(self.model)
+        model.reps = int(self._reps.value)
+        return model
+
+    def _create_yaml_map(self):
+        pass
+
+class SimulatedClock:
+    """
+    Clock of a FakeQuantumMachine that only advances when told to, so jobs
+    of any length are simulated as fast as the host polls them.
+    """
+    def __init__(self, start: float = 0.):
+        self.now = start
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, delay: float):
+        """
+        Advances the clock by delay seconds, e.g. as the sleep function of an
+        AdaptivePoller.
+        """
+        self.now += max(delay, 0.)
+
+# ---------------------------------- Backend -----------------------------------
+
+class FakeResultHandle:
+    """
+    Result handle of one tag, generating the results of the job when fetched.
+    """
+    def __init__(self, job, tag):
+        self._job = job
+        self._tag = tag
+
+    def count_so_far(self):
+        return self._job._count_so_far()
+
+    def fetch(self, item, flat_struct = False):
+        self._job._generate(self._job._count_so_far())
+        data = self._job._buffers[self._tag].data
+        return data[item]
+
+    def fetch_all(self, flat_struct = False):
+        return self.fetch(slice(0, self.count_so_far()), flat_struct)
+
+    def wait_for_all_values(self, timeout = None):
+        self._job._wait_until(self._job.end, timeout)
+        return not self._job._running()
+
+class FakeResultHandles:
+    def __init__(self, job):
+        self._job = job
+        self._handles = {tag: FakeResultHandle(job, tag)
+                         for tag in (job.model.result_tags if job.model else ())}
+
+    def get(self, tag):
+        return self._handles.get(tag)
+
+    def is_processing(self):
+        return self._job._running()
+
+    def wait_for_all_values(self, timeout = None):
+        self._job._wait_until(self._job.end, timeout)
+        return not self._job._running()
+
+class FakeJob:
+    """
+    Running or concluded job of a FakeQuantumMachine.
+    """
+    def __init__(self, machine, job_id: int, program, model: SweepModel):
+        self._machine = machine
+        self._id = job_id
+        self.program = program
+        self.model = model
+        self.start = None
+        self.end = None
+        self.halted = False
+        self._rng = np.random.default_rng(machine.seed_sequence.spawn(1)[0])
+        self._buffers = {}
+        self._sum = None
+        self.result_handles = FakeResultHandles(self)
+
+    @property
+    def id(self):
+        return self._id
+
+    def duration(self):
+        if self.model is None:
+            # e.g. the infinite loop of MixerTuner, runs until halted
+            return np.inf
+        return self.model.reps * self.model.sweep_size \
+               / self._machine.shot_rate
+
+    def _running(self):
+        now = self._machine.clock()
+        return self.start is not None and self.start <= now < self.end
+
+    def _wait_until(self, t, timeout = None):
+        delay = t - self._machine.clock()
+        if timeout is not None:
+            delay = min(delay, timeout)
+        if np.isfinite(delay) and delay > 0:
+            # a simulated clock is advanced rather than waited for
+            getattr(self._machine.clock, 'sleep', time.sleep)(delay)
+
+    def _count_so_far(self):
+        if self.model is None or self.start is None:
+            return 0
+        now = self._machine.clock()
+        if now >= self.end and not self.halted:
+            # avoids losing the last repetition to rounding
+            return self.model.reps
+        elapsed = min(now, self.end) - self.start
+        shots = max(elapsed, 0.) * self._machine.shot_rate
+        return min(int(shots // self.model.sweep_size), self.model.reps)
+
+    def _generate(self, count):
+        """
+        Generates the results of the repetitions up to count.
+        """
+        model = self.model
+        if not self._buffers:
+            self._buffers = {tag: ResultBuffer(capacity=model.reps,
+                                               shot_shape=model.sweep_shape,
+                                               dtype=float)
+                             for tag in model.result_tags}
+            self._signal = model.signal()
+            self._sum = np.zeros(model.sweep_shape, dtype=complex)
+        done = len(self._buffers[model.result_tags[0]])
+        if count <= done:
+            return
+        n_new = count - done
+        shape = (n_new,) + model.sweep_shape
+        shots = self._signal + model.noise \
+                * (self._rng.standard_normal(shape)
+                   + 1j * self._rng.standard_normal(shape))
+        running_sum = self._sum + np.cumsum(shots, axis=0)
+        averages = running_sum / np.arange(done + 1, count + 1) \
+                                  .reshape((-1,) + (1,) * len(model.sweep_shape))
+        self._sum = running_sum[-1]
+        i_tag, q_tag, i_avg_tag, q_avg_tag = model.result_tags
+        self._buffers[i_tag].append(shots.real)
+        self._buffers[q_tag].append(shots.imag)
+        self._buffers[i_avg_tag].append(averages.real)
+        self._buffers[q_avg_tag].append(averages.imag)
+
+    def is_paused(self):
+        # the QM job raises once it has concluded, see JobHandle.status
+        if not self._running():
+            raise RuntimeError('Job %d has concluded.' % self._id)
+        return False
+
+    def resume(self):
+        return True
+
+    def halt(self):
+        now = self._machine.clock()
+        if self._running():
+            self.end = now
+            self.halted = True
+        self._machine.queue._schedule()
+        return True
+
+class FakeQueuedJob:
+    """
+    Job added to the queue of a FakeQuantumMachine.
+    """
+    def __init__(self, queue, job: FakeJob):
+        self._queue = queue
+        self._job = job
+
+    def id(self):
+        return self._job.id
+
+    def position_in_queue(self):
+        """
+        Position (from 1) among the jobs waiting in the queue, None if the job
+        has started or was removed.
+        """
+        waiting = self._queue._waiting()
+        if self._job not in waiting:
+            return None
+        return waiting.index(self._job) + 1
+
+    def wait_for_execution(self, timeout = None):
+        self._queue._schedule()
+        if self._job.start is None:
+            raise RuntimeError('Job %d was removed from the queue.'
+                               % self._job.id)
+        self._job._wait_until(self._job.start, timeout)
+        return self._job
+
+    def cancel(self):
+        return self._queue._remove(self._job)
+
+class FakeQueue:
+    """
+    Queue of a FakeQuantumMachine, jobs run one at a time in queue order.
+    """
+    def __init__(self, machine):
+        self._machine = machine
+        self._jobs = []
+
+    def add(self, program) -> FakeQueuedJob:
+        job = self._machine._new_job(program)
+        job.added = self._machine.clock()
+        self._jobs.append(job)
+        self._schedule()
+        return FakeQueuedJob(self, job)
+
+    def _schedule(self):
+        """
+        Sets the start and end times of the jobs that have not started yet.
+        """
+        now = self._machine.clock()
+        last_end = -np.inf
+        for job in self._jobs:
+            if job.start is None or job.start > now:
+                job.start = max(job.added, last_end)
+                job.end = job.start + job.duration()
+            last_end = job.end
+
+    def _waiting(self):
+        now = self._machine.clock()
+        self._schedule()
+        return [job for job in self._jobs if job.start > now]
+
+    def _remove(self, job):
+        if job not in self._waiting():
+            return False
+        self._jobs.remove(job)
+        job.start = job.end = None
+        self._schedule()
+        return True
+
+    @property
+    def count(self):
+        return len(self._waiting())
+
+    def busy_time(self):
+        """
+        Seconds the simulated hardware spent executing jobs so far.
+        """
+        now = self._machine.clock()
+        return sum(max(min(job.end, now) - job.start, 0.)
+                   for job in self._jobs if job.start is not None)
+
+class FakeQuantumMachine:
+    """
+    Simulated QuantumMachine, see the module docstring.
+    """
+    def __init__(self, config: dict = None, model: SweepModel = None,
+                 shot_rate: float = DEFAULT_SHOT_RATE, seed = None,
+                 clock = time.perf_counter):
+        """
+        Arguments:
+            config (dict) : QM config returned by get_config()
+            model (SweepModel) : model of the programs queued that are not a
+                SweepModel themselves
+            shot_rate (float) : shots (sweep points) acquired per second
+            seed : seed of the noise of the generated results
+            clock : function returning the current time in seconds
+        """
+        self.config = config if config is not None else {}
+        self.model = model
+        self.shot_rate = shot_rate
+        self.seed_sequence = np.random.SeedSequence(seed)
+        self.clock = clock
+        self.id = 'fake_qm'
+        self.queue = FakeQueue(self)
+        self.dc_offsets = {}
+        self.mixer_corrections = {}
+        self._job_ids = itertools.count(1)
+
+    def _new_job(self, program) -> FakeJob:
+        model = program if isinstance(program, SweepModel) else self.model
+        return FakeJob(self, next(self._job_ids), program, model)
+
+    def execute(self, program) -> FakeJob:
+        """
+        Halts the running job and runs program right away, jobs waiting in the
+        queue start after it.
+        """
+        now = self.clock()
+        for job in self.queue._jobs:
+            if job._running():
+                job.halt()
+        job = self._new_job(program)
+        job.added = job.start = now
+        job.end = now + job.duration()
+        started = [queued for queued in self.queue._jobs
+                   if queued.start <= now]
+        self.queue._jobs.insert(len(started), job)
+        self.queue._schedule()
+        return job
+
+    def get_config(self) -> dict:
+        return self.config
+
+    def set_output_dc_offset_by_element(self, element: str, port: str,
+                                        offset: float):
+        self.dc_offsets[(element, port)] = offset
+
+    def set_mixer_correction(self, mixer: str, intermediate_frequency: int,
+                             lo_frequency: int, values):
+        self.mixer_corrections[(mixer, intermediate_frequency,
+                                lo_frequency)] = tuple(values)
+
+    def close(self):
+        for job in self.queue._jobs:
+            if job._running():
+                job.halt()
+        return True
+
+class FakeQuantumMachinesManager:
+    """
+    Stand-in for QuantumMachinesManager opening FakeQuantumMachines.
+    """
+    def __init__(self, **machine_options):
+        """
+        Arguments:
+            machine_options : arguments of the opened FakeQuantumMachines
+        """
+        self._machine_options = machine_options
+        self.machines = []
+
+    def open_qm(self, config: dict, close_other_machines: bool = True):
+        if close_other_machines:
+            for machine in self.machines:
+                machine.close()
+        machine = FakeQuantumMachine(config, **self._machine_options)
+        self.machines.append(machine)
+        return machine
@@ -0,0 +1,154 @@
+"""
+Non-blocking handle of a job submitted to the QM queue.
+
+A JobHandle wraps the queued job returned by quantum_machine.queue.add(). It
+never sleeps: status(), position() and done() issue at most one round of QM
+calls and cache the answer for status_ttl seconds, and a concluded or
+cancelled job is never queried again. result() polls (with backoff) only when
+the caller explicitly waits for the job to conclude. A JobHandle can be
+queried from several threads.
+"""
+import threading
+import time
+
+DEFAULT_STATUS_TTL = 0.1  # seconds a queried status is reused
+MAX_POLL_INTERVAL = 0.5  # seconds, longest wait between two polls in result()
+
+class JobHandle:
+    """
+    Future-like view of a queued QM job, with status 'queued', 'in execution',
+    'concluded' or 'cancelled'.
+    """
+    def __init__(self, queued_job, status_ttl: float = DEFAULT_STATUS_TTL):
+        """
+        Arguments:
+            queued_job : the object returned by quantum_machine.queue.add()
+            status_ttl (float) : seconds during which a queried status is
+                reused instead of asking the QM server again
+        """
+        self.queued_job = queued_job
+        self.status_ttl = status_ttl
+        self._job = None
+        self._status = None
+        self._position = None
+        self._status_time = -float('inf')
+        # time of the last query, or of the creation of the handle
+        self._last_seen = time.monotonic()
+        # status to (time of the last query that saw the previous status,
+        # time of the first query that saw this one)
+        self._transitions = {}
+        self._lock = threading.RLock()
+
+    def __repr__(self):
+        return 'JobHandle(id={}, status={})'.format(self.id(), self._status)
+
+    def id(self):
+        return self.queued_job.id()
+
+    def status(self, refresh: bool = False):
+        """
+        Returns the (cached) status of the job. refresh=True ignores the cache.
+        """
+        with self._lock:
+            return self._query_status(refresh)
+
+    def _query_status(self, refresh):
+        if self._status in ('concluded', 'cancelled'):
+            return self._status
+        if not refresh and time.monotonic() - self._status_time < self.status_ttl:
+            return self._status
+
+        if self._job is None:
+            self._position = self.queued_job.position_in_queue()
+            if self._position is not None:
+                self._set_status('queued')
+                return self._status
+            # Not in the queue anymore, so this returns right away
+            self._job = self.queued_job.wait_for_execution()
+
+        try:
+            # The is_paused() function is a poor workaround to know if the
+            # job has concluded, because QM documentation doesn't have any
+            # function for this.
+            self._job.is_paused()
+            self._set_status('in execution')
+        except Exception:
+            self._set_status('concluded')
+        return self._status
+
+    def _set_status(self, status):
+        now = time.monotonic()
+        if status != self._status:
+            window = (self._last_seen, now)
+            if status == 'concluded':
+                # also started in this window if it was never seen running
+                self._transitions.setdefault('in execution', window)
+            self._transitions[status] = window
+        self._status = status
+        self._status_time = self._last_seen = now
+
+    def execution_window(self):
+        """
+        Returns (start, end), the time.monotonic() estimates of when the job
+        started and concluded, None if not observed yet. Each is the middle of
+        the interval between the last query that saw the previous status and
+        the first that saw the new one. A job that started and concluded
+        between two queries is taken to have run during the whole interval.
+        """
+        with self._lock:
+            started = self._transitions.get('in execution')
+            ended = self._transitions.get('concluded') \
+                    or self._transitions.get('cancelled')
+        if started is not None and started is ended:
+            return started
+        middle = lambda window: None if window is None else sum(window) / 2
+        return middle(started), middle(ended)
+
+    def position(self):
+        """
+        Returns the position of the job in the QM queue, None if it left the queue.
+        """
+        return self._position if self.status() == 'queued' else None
+
+    def done(self):
+        return self.status() in ('concluded', 'cancelled')
+
+    def job(self):
+        """
+        Returns the running (or concluded) QM job, None while it is queued.
+        """
+        if self._job is None:
+            self.status()
+        return self._job
+
+    def result(self, timeout: float = None):
+        """
+        Waits until the job concludes and returns its result handles.
+
+        Raises:
+            TimeoutError if the job has not concluded after timeout seconds
+        """
+        start = time.monotonic()
+        interval = 0.001
+        while self.status(refresh=True) not in ('concluded', 'cancelled'):
+            if timeout is not None and time.monotonic() - start >= timeout:
+                raise TimeoutError('Job %s has not concluded after %s s.'
+                                   % (self.id(), timeout))
+            time.sleep(interval)
+            interval = min(2 * interval, MAX_POLL_INTERVAL)
+        if self._job is None:
+            return None
+        return self._job.result_handles
+
+    def cancel(self):
+        """
+        Removes the job from the queue or halts it if it is running.
+        """
+        with self._lock:
+            status = self._query_status(refresh=True)
+            if status == 'queued':
+                self.queued_job.cancel()
+            elif status == 'in execution':
+                self._job.halt()
+            if status != 'concluded':
+                self._set_status('cancelled')
@@ -2,12 +2,23 @@
 Measurement.
 """
 from abc import abstractmethod
+import asyncio
+import functools
 import time
 import numpy as np
 
+from measurements.job_handle import JobHandle
+from measurements.poller import AdaptivePoller
+from measurements.result_buffer import ResultBuffer
 from parameter import Parameter
+from result.hdf5_register import read_dict_from_hdf5, write_dict_to_hdf5
 from utils.yamlizer import Yamlable
 
+# Group of the sink DatasetFile holding the checkpoint of a job
+CHECKPOINT_GROUP = 'checkpoint'
+# Seconds between two polls of the async interface
+DEFAULT_POLL_INTERVAL = 0.1
+
 class Measurement(Yamlable):
     """
     Abstract base class for Measurement.
@@ -16,13 +27,43 @@ class Measurement(Yamlable):
     file as it inherits from yamlable.
     
     The class provides the methods to queue a job and to diagnose its status.
+
+    Fetched results can be streamed to a sink, any object with an
+    append(tag, batch) method such as a DatasetFile (only the tags in
+    sink_tags if given). In that case saved_results only keeps the last
+    tail_length rows of every result tag (nothing if tail_length is 0,
+    everything if it is None). Reducers in the dict reducers, such as
+    IQStats, are updated with every fetched batch, so statistics of the
+    single shots are available without keeping or saving them.
+
+    If the sink is a DatasetFile, the number of completed repetitions and the
+    running averages (tags ending with '_avg') are checkpointed into it every
+    checkpoint_interval seconds and when a running job is cancelled. resume()
+    then queues only the remaining repetitions and merges the new averages
+    with the checkpointed ones, weighted by their repetition counts.
+
+    The *_async methods and stream_results are asyncio counterparts that run
+    the blocking QM calls on an executor, so several measurements can be
+    driven from one event loop.
     """
-    def __init__(self, name: str, quantum_machine):
+    def __init__(self, name: str, quantum_machine, sink = None,
+                 tail_length: int = None, checkpoint_interval: float = None,
+                 sink_tags: list = None):
         self._name = name
         self._quantum_machine = quantum_machine
-        self._job = None
-        self._queued_job = None
-        self.saved_results = {}
+        self._handle = None
+        # SweepGrid of the routine, set by _script()
+        self._sweep_grid = None
+        self.sink = sink
+        self.sink_tags = sink_tags
+        self.tail_length = tail_length
+        # Streaming reducers (see measurements.reducers) updated by results()
+        self.reducers = {}
+        self.checkpoint_interval = checkpoint_interval
+        self._last_checkpoint = time.time()
+        # Executor of the blocking QM calls of the async interface
+        self.executor = None
+        self._reset_results()
 
     @abstractmethod
     def _create_parameters(self):
@@ -62,46 +103,55 @@ class Measurement(Yamlable):
         """
         pass
     
-    def queue_job(self):
+    def queue_job(self, program = None):
         """
-        TODO
+        Queues the QUA program of this measurement, after halting or removing
+        its previous job. Does not wait for the job to start.
+
+        Arguments: program, the QUA program to queue if it was already built
+        with self._script().
+
+        Returns: JobHandle of the queued job, with non-blocking done(),
+        position() and status() and a blocking result().
         """
          
         current_status = self._current_status()
         
-        if current_status == 'in execution':
-            print('Cleaning last job.')
-            self._job.halt()
-        
-        if current_status == 'queued':
+        if current_status in ('in execution', 'queued'):
             print('Cleaning last job.')
-            self._queued_job.cancel()
+            self._handle.cancel()
         
         if current_status == 'concluded':
             print('Cleaning last job.')
         
-        self._job = None
-        self._queued_job = None
-        self.saved_results = {}
+        self._handle = None
+        self._reset_results()
         
         print('Queueing new job.')
-        self._queued_job = self._quantum_machine.queue.add(self._script())
-        # Waits for it to start excecution if queue is empty
-        time.sleep(3)
-        q_posit = self._queued_job.position_in_queue()
-        job_id = self._queued_job.id()
-        
-        if q_posit == None:
-            self._job = self._queued_job.wait_for_execution()
-            print('Job in execution. (ID: %s)' % (job_id))
-        if type(q_posit).__name__ == 'int':
-            print('Job in queue position #%d. (ID: %s)' % (q_posit, job_id))
-        
-        return
+        if program is None:
+            program = self._script()
+        self._handle = JobHandle(self._quantum_machine.queue.add(program))
+        
+        q_posit = self._handle.position()
+        if q_posit is None:
+            print('Job in execution. (ID: %s)' % (self._handle.id()))
+        else:
+            print('Job in queue position #%d. (ID: %s)' % (q_posit, 
+                                                         self._handle.id()))
+        
+        return self._handle
+
+    @property
+    def job_handle(self):
+        """
+        JobHandle of the last queued job, None if no job was queued.
+        """
+        return self._handle
     
     def cancel_job(self):
         """
-        TODO
+        Halts the running job or removes the queued job, and erases its
+        results (a running job is checkpointed first if possible).
         """
         current_status = self._current_status()
         if current_status == 'not queued':
@@ -109,18 +159,20 @@ class Measurement(Yamlable):
             return
         
         if current_status == 'in execution':
-            self._job.halt()
-            self._job = None
-            self._queued_job = None
-            self.saved_results = {}
+            if self._checkpoint_target() is not None:
+                # Keeps what was acquired so far, see resume()
+                self.results()
+                self.checkpoint()
+            self._handle.cancel()
+            self._handle = None
+            self._reset_results()
             print('Job was interrupted and erased.')
             return
         
         if current_status == 'queued':
-            self._queued_job.cancel()
-            self._job = None
-            self._queued_job = None
-            self.saved_results = {}
+            self._handle.cancel()
+            self._handle = None
+            self._reset_results()
             print('Queued Job was removed and erased.')
             return
         
@@ -130,7 +182,7 @@ class Measurement(Yamlable):
     
     def status(self):
         """
-        TODO
+        Prints the status of the last queued job.
         """
         current_status = self._current_status()
         
@@ -144,39 +196,28 @@ class Measurement(Yamlable):
             print('Job has concluded.')
             
         if current_status == 'queued':
-            q_posit = self._queued_job.position_in_queue()
+            q_posit = self._handle.position()
             print('Job is queued in position #%d' % q_posit)
         
-        return
+        return current_status
     
     def _current_status(self):
         """
-        TODO
+        Returns 'not queued', 'queued', 'in execution' or 'concluded'. The
+        status is cached by the job handle, see JobHandle.status_ttl.
         """
-        
-        was_queued = True if self._queued_job else False
-        
-        if not was_queued:
+        if self._handle is None:
             return 'not queued'
-        
-        q_posit = self._queued_job.position_in_queue()
-        
-        if q_posit == None:
-            self._job = self._queued_job.wait_for_execution()
-            try: 
-                # The is_paused() function is a poor workaround to know if the
-                # job has concluded, because QM documentation doesn't have any
-                # function for this.
-                self._job.is_paused()
-                return 'in execution'
-            except:
-                return 'concluded'
-        if type(q_posit).__name__ == 'int':
-            return 'queued'
+        status = self._handle.status()
+        if status == 'cancelled':
+            # cancelled through the handle, a job that ran keeps its results
+            return 'concluded' if self._handle.job() is not None \
+                   else 'not queued'
+        return status
 
     def result_handles(self):
         """
-        TODO
+        Returns the result handles of the running or concluded job.
         """
         
         current_status = self._current_status()
@@ -189,11 +230,141 @@ class Measurement(Yamlable):
             print('Job still in queue.')
             return
         
-        return self._job.result_handles
+        return self._handle.job().result_handles
+
+    def _reset_results(self):
+        """
+        Forgets all results fetched from the last job.
+        """
+        self.saved_results = {}
+        self._result_buffers = {}
+        # Number of datapoints fetched so far from the result handles
+        self._fetched_count = 0
+        # Last fetched row of every average tag, kept for checkpoints
+        self._last_averages = {}
+        # Repetition count and averages of the checkpoint being resumed
+        self._resume_state = None
+        for reducer in self.reducers.values():
+            reducer.reset()
+
+    def _expected_count(self):
+        """
+        Returns the number of datapoints each result tag will hold once the
+        job concludes, or None if it is not known in advance.
+        """
+        reps = getattr(self, '_reps', None)
+        if reps is None or reps.value is None:
+            return None
+        return int(reps.value)
+
+    def _avg_tags(self):
+        return [tag for tag in self._result_tags if tag.endswith('_avg')]
+
+    def _checkpoint_target(self, datafile = None):
+        """
+        Returns the hdf5 file checkpoints are written to, None if there is none.
+        """
+        target = datafile if datafile is not None else self.sink
+        return target if hasattr(target, 'create_group') else None
+
+    def _completed_reps(self):
+        done = self._fetched_count
+        if self._resume_state is not None:
+            done += self._resume_state['count']
+        return done
+
+    def _merge_averages(self, tag, new_results, prev_count):
+        """
+        Combines running averages of the resumed job with the checkpointed
+        average, weighting both by their number of repetitions.
+        """
+        count = self._resume_state['count']
+        average = self._resume_state['averages'][tag]
+        new_counts = prev_count + np.arange(1, new_results.shape[0] + 1)
+        new_counts = new_counts.reshape((-1,) + (1,) * (new_results.ndim - 1))
+        return (count * average + new_counts * new_results) \
+               / (count + new_counts)
+
+    def checkpoint(self, datafile = None):
+        """
+        Writes the number of completed repetitions, the latest averages and
+        the lengths of the result streams to the group CHECKPOINT_GROUP of
+        datafile (the sink by default). Raw results are persisted by the sink
+        streams themselves.
+        """
+        target = self._checkpoint_target(datafile)
+        if target is None:
+            print('No DatasetFile to checkpoint to.')
+            return
+        if hasattr(target, 'flush'):
+            # makes sure the streams hold everything counted below
+            target.flush()
+
+        if self._resume_state is not None:
+            total_reps = self._resume_state['reps']
+        else:
+            total_reps = self._expected_count()
+        checkpoint = {'count': self._completed_reps(),
+                      'reps': total_reps,
+                      'timestamp': time.time(),
+                      'averages': dict(self._last_averages),
+                      'streams': {tag: target[tag].shape[0]
+                                  for tag in self._result_tags
+                                  if tag in target}}
+        write_dict_to_hdf5({CHECKPOINT_GROUP: checkpoint}, target,
+                           group_overwrite_level=0)
+        if hasattr(target, 'flush'):
+            target.flush()
+        self._last_checkpoint = time.time()
+
+    def resume(self, datafile = None):
+        """
+        Queues the repetitions missing from the checkpoint in datafile (the
+        sink by default). Averages fetched afterwards include the checkpointed
+        repetitions. Rows appended to the result streams after the checkpoint
+        (e.g. before a crash) are dropped, as they are measured again, and the
+        new rows are appended to datafile, which becomes the sink. After a
+        crash, reopen the run file with DatasetFile(..., filepath=path).
+        """
+        target = self._checkpoint_target(datafile)
+        if target is None or CHECKPOINT_GROUP not in target:
+            print('No checkpoint to resume from.')
+            return
+        if not hasattr(target, 'append'):
+            raise ValueError('Resuming needs a DatasetFile to append the new '
+                             'results to, not %r.' % target)
+
+        checkpoint = read_dict_from_hdf5({}, target[CHECKPOINT_GROUP])
+        count, total_reps = int(checkpoint['count']), checkpoint['reps']
+        if total_reps is None or count >= total_reps:
+            print('Checkpointed job is already complete.')
+            return
+
+        if hasattr(target, 'flush'):
+            target.flush()
+        for tag, length in checkpoint.get('streams', {}).items():
+            if tag in target and target[tag].shape[0] > length:
+                target[tag].resize(int(length), axis=0)
+
+        if target is not self.sink:
+            # the remaining repetitions go to the trimmed streams
+            self.sink = target
+
+        print('Resuming from %d of %d repetitions.' % (count, total_reps))
+        self._reps.value = int(total_reps) - count
+        try:
+            self.queue_job()
+        finally:
+            self._reps.value = total_reps
+        self._resume_state = {'count': count, 'reps': int(total_reps),
+                              'averages': checkpoint.get('averages', {})}
 
     def results(self):
         '''
-        Returns: [TODO] 
+        Fetches the datapoints acquired since the last call, forwards them to
+        the sink (if any) and adds them to saved_results.
+
+        Returns: dict of result tag to array of the saved results.
         '''
         
         current_status = self._current_status()
@@ -206,24 +377,66 @@ class Measurement(Yamlable):
             print('Job was not queued.')
             return
         
+        new_results = self._fetch_new_results(current_status)
+        
+        if new_results is None:
+            return
+        
+        if new_results and current_status == 'in execution':
+            print('Returning partial results of %d ' % self._fetched_count + \
+                  'iterations (job not concluded).')
+
+        return self.saved_results
+
+    def poll_results(self, callback = None, timeout: float = None,
+                     **poller_options):
+        '''
+        Fetches results with an AdaptivePoller until the job concludes.
+
+        Arguments: callback and timeout, see AdaptivePoller.run, and the
+        options of AdaptivePoller (target_batch, min_interval...).
+
+        Returns: the AdaptivePoller, with the per-poll latencies and fetched
+        bytes in its history. The results are in saved_results.
+        '''
+        poller = AdaptivePoller(self, **poller_options)
+        poller.run(callback, timeout)
+        return poller
+
+    def _fetch_new_results(self, current_status):
+        '''
+        Fetches the datapoints acquired since the last call, forwards them to
+        the sink (if any) and adds them to saved_results.
+
+        Returns: dict of result tag to array of the new datapoints (empty if
+        there are none), None if the job has no result handles.
+        '''
         res_handles = self.result_handles()
         
         if not res_handles:
             return
         
+        if not self.saved_results:
+            self.saved_results = {tag:np.array([]) 
+                                  for tag in self._result_tags}
         results = self.saved_results
-        if not results:
-            results = {tag:np.array([]) for tag in self._result_tags}
+        if not self._result_buffers and self.tail_length != 0:
+            capacity = self._expected_count() or 0
+            self._result_buffers = {tag:ResultBuffer(capacity=capacity,
+                                                     maxlen=self.tail_length)
+                                    for tag in self._result_tags}
         
         random_result_tag = self._result_tags[0] 
         
         # Counts how many new datapoints to fetch
-        prev_count = results[random_result_tag].shape[0]
+        prev_count = self._fetched_count
         new_count = res_handles.get(random_result_tag).count_so_far()
         
         if prev_count == new_count:
-            return results
+            return {}
 
+        avg_tags = self._avg_tags()
+        fetched = {}
         for tag in self._result_tags:
             new_results = res_handles.get(tag) \
                                      .fetch(slice(prev_count, new_count), 
@@ -231,18 +444,111 @@ class Measurement(Yamlable):
             if prev_count - new_count == 1:
                 new_results = np.array([new_results])
                 # TODO correct this
-            if list(results[tag]):
-                results[tag] = np.append(results[tag], new_results, 
-                                         axis = 0)     
-            else:
-                results[tag] = new_results
+            if self._sweep_grid is not None:
+                # One (zero-copy) N-D sweep per repetition for every routine
+                new_results = self._sweep_grid.reshape(new_results)
+            if (self._resume_state is not None 
+                    and tag in self._resume_state['averages']):
+                new_results = self._merge_averages(tag, new_results, 
+                                                   prev_count)
+            if tag in avg_tags and len(new_results):
+                self._last_averages[tag] = new_results[-1]
+            fetched[tag] = new_results
+            if self.sink is not None and (self.sink_tags is None 
+                                          or tag in self.sink_tags):
+                self.sink.append(tag, new_results)
+            if self.tail_length == 0:
+                continue
+            # Amortized O(new data) append, results are views of the buffer
+            self._result_buffers[tag].append(new_results)
+            results[tag] = self._result_buffers[tag].data
                   
-        self.saved_results = results
+        self._fetched_count = new_count
 
-        if current_status == 'in execution':
-            print('Returning partial results of %d ' % new_count + \
-                  'iterations (job not concluded).')
+        for reducer in self.reducers.values():
+            reducer.update(fetched)
 
-        return results
+        if current_status == 'concluded' and hasattr(self.sink, 'flush'):
+            self.sink.flush()
 
+        if (self.checkpoint_interval is not None
+                and self._checkpoint_target() is not None
+                and (current_status == 'concluded' or time.time() 
+                     - self._last_checkpoint >= self.checkpoint_interval)):
+            self.checkpoint()
+
+        return fetched
+
+    async def _run_blocking(self, function, *args):
+        """
+        Runs a blocking (QM client) call on self.executor, the default
+        executor of the event loop if None.
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, 
+                                          functools.partial(function, *args))
+
+    async def queue_job_async(self):
+        """
+        Async counterpart of queue_job, the QUA program is built and queued
+        on the executor.
+        """
+        return await self._run_blocking(self.queue_job)
+
+    async def status_async(self):
+        """
+        Async counterpart of status, also returns the current status.
+        """
+        return await self._run_blocking(self.status)
+
+    async def wait_async(self, poll_interval: float = DEFAULT_POLL_INTERVAL, 
+                         timeout: float = None):
+        """
+        Waits without blocking the event loop until the job has concluded.
+        
+        Raises: TimeoutError if it has not concluded after timeout seconds
+        """
+        start = time.monotonic()
+        while await self._run_blocking(self._current_status) \
+                in ('queued', 'in execution'):
+            if timeout is not None and time.monotonic() - start >= timeout:
+                raise TimeoutError('Job has not concluded after %s s.' 
+                                   % timeout)
+            await asyncio.sleep(poll_interval)
+
+    async def results_async(self, wait: bool = False):
+        """
+        Async counterpart of results. If wait is True, first waits for the
+        job to conclude (see wait_async).
+        """
+        if wait:
+            await self.wait_async()
+        return await self._run_blocking(self.results)
+
+    async def stream_results(self, 
+                             poll_interval: float = DEFAULT_POLL_INTERVAL):
+        """
+        Async iterator over the new datapoints of the job, yields a dict of
+        result tag to the rows acquired since the previous item, every time
+        count_so_far() advances, until the job has concluded. The fetched data
+        also goes to saved_results and the sink as with results(), which
+        should not be called concurrently.
+        
+        Usage: async for batch in measurement.stream_results(): ...
+        """
+        while True:
+            current_status = await self._run_blocking(self._current_status)
+            if current_status == 'not queued':
+                return
+            if current_status == 'queued':
+                await asyncio.sleep(poll_interval)
+                continue
+            
+            new_results = await self._run_blocking(self._fetch_new_results,
+                                                   current_status)
+            if new_results:
+                yield new_results
+            if current_status == 'concluded' or new_results is None:
+                return
+            await asyncio.sleep(poll_interval)
 
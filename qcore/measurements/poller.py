@@ -0,0 +1,153 @@
+"""
+Adaptive polling of the results of a running Measurement.
+
+An AdaptivePoller fetches new results of a measurement until its job
+concludes. Instead of a fixed interval, it waits between two polls about the
+time the job takes to produce target_batch new repetitions, estimated from the
+observed data rate, and backs off (up to max_interval) while nothing new
+arrives, e.g. while the job is queued. Every poll asks count_so_far() once
+and fetches all result tags only if there is new data, and its latency and
+fetched bytes are recorded in history.
+"""
+import time
+import numpy as np
+
+DEFAULT_MIN_INTERVAL = 0.01  # seconds
+DEFAULT_MAX_INTERVAL = 1.0  # seconds, bounds the delay of live data
+DEFAULT_POLLS_PER_JOB = 100  # sets the default target batch of known jobs
+DEFAULT_TARGET_BATCH = 100  # repetitions, if the job length is not known
+DEFAULT_BACKOFF = 2.0  # interval factor after a poll without new data
+DEFAULT_SMOOTHING = 0.3  # weight of the last poll in the data rate estimate
+
+class AdaptivePoller:
+    """
+    Polls the results of a measurement at an interval adapted to its data rate.
+
+    Usage:
+        poller = AdaptivePoller(measurement)
+        measurement.queue_job()
+        results = poller.run(callback=update_plot)
+        print(poller.stats())
+    """
+    def __init__(self, measurement, target_batch: int = None,
+                 min_interval: float = DEFAULT_MIN_INTERVAL,
+                 max_interval: float = DEFAULT_MAX_INTERVAL,
+                 backoff: float = DEFAULT_BACKOFF,
+                 smoothing: float = DEFAULT_SMOOTHING,
+                 clock = time.perf_counter, sleep = time.sleep):
+        """
+        Arguments:
+            measurement (Measurement) : measurement whose job is polled
+            target_batch (int) : number of new repetitions to fetch per poll,
+                by default 1/DEFAULT_POLLS_PER_JOB of the job
+            min_interval, max_interval (float) : bounds of the interval
+                between two polls, in seconds
+            backoff (float) : factor applied to the interval after a poll
+                without new data
+            smoothing (float) : weight of the last poll in the moving
+                average of the data rate
+            clock, sleep : time functions, replaceable for simulations
+        """
+        self.measurement = measurement
+        self._target_batch = target_batch
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.smoothing = smoothing
+        self.clock = clock
+        self.sleep = sleep
+        self.reset()
+
+    def reset(self):
+        self.interval = self.min_interval
+        # repetitions per second
+        self.rate = None
+        self.history = []
+        self._last_poll = None
+
+    @property
+    def target_batch(self):
+        if self._target_batch is not None:
+            return self._target_batch
+        expected = self.measurement._expected_count()
+        if expected is None:
+            return DEFAULT_TARGET_BATCH
+        return max(1, expected // DEFAULT_POLLS_PER_JOB)
+
+    def poll(self):
+        """
+        Fetches the new results once and adapts the interval.
+
+        Returns: (status of the job, dict of result tag to new rows)
+        """
+        start = self.clock()
+        status = self.measurement._current_status()
+        batches = None
+        if status in ('in execution', 'concluded'):
+            batches = self.measurement._fetch_new_results(status)
+        batches = batches or {}
+        latency = self.clock() - start
+
+        rows = len(next(iter(batches.values()))) if batches else 0
+        n_bytes = sum(np.asarray(batch).nbytes for batch in batches.values())
+        self._adapt(rows, start)
+        self.history.append({'time': start, 'status': status,
+                             'latency': latency, 'rows': rows,
+                             'bytes': n_bytes, 'interval': self.interval})
+        return status, batches
+
+    def _adapt(self, rows, now):
+        """
+        Sets the interval to the time the job takes to produce target_batch
+        repetitions at the estimated rate, or backs off if rows is 0.
+        """
+        elapsed = None if self._last_poll is None else now - self._last_poll
+        self._last_poll = now
+        if rows and elapsed:
+            rate = rows / elapsed
+            self.rate = rate if self.rate is None else \
+                self.smoothing * rate + (1 - self.smoothing) * self.rate
+            interval = self.target_batch / self.rate
+        elif rows:
+            # first poll with data, the rate is not known yet
+            interval = self.interval
+        else:
+            interval = self.interval * self.backoff
+        self.interval = min(max(interval, self.min_interval),
+                            self.max_interval)
+
+    def run(self, callback = None, timeout: float = None):
+        """
+        Polls until the job has concluded and all its results are fetched.
+
+        Arguments:
+            callback : callable(dict of result tag to new rows), called after
+                every poll that fetched new data, e.g. to update a live plot
+            timeout (float) : seconds after which TimeoutError is raised
+
+        Returns: saved_results of the measurement
+        """
+        start = self.clock()
+        while True:
+            status, batches = self.poll()
+            if batches and callback is not None:
+                callback(batches)
+            if status in ('concluded', 'not queued'):
+                return self.measurement.saved_results
+            if timeout is not None and self.clock() - start >= timeout:
+                raise TimeoutError('Job has not concluded after %s s.'
+                                   % timeout)
+            self.sleep(self.interval)
+
+    def stats(self) -> dict:
+        """
+        Returns the number of polls (and of polls without new data), the
+        fetched repetitions and bytes, and the mean and max poll latency.
+        """
+        latencies = [poll['latency'] for poll in self.history]
+        return {'polls': len(self.history),
+                'empty_polls': sum(not poll['rows'] for poll in self.history),
+                'rows': sum(poll['rows'] for poll in self.history),
+                'bytes': sum(poll['bytes'] for poll in self.history),
+                'mean_latency': float(np.mean(latencies)) if latencies else None,
+                'max_latency': max(latencies) if latencies else None}
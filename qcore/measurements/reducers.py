@@ -0,0 +1,241 @@
+"""
+Host-side streaming reducers of single-shot results.
+
+A reducer is attached to a Measurement with measurement.reducers[name] =
+reducer and updated by Measurement.results() with every fetched batch, at a
+cost proportional to the new data. It keeps its statistics over the whole job
+even if the raw shots are neither kept (tail_length=0) nor saved (sink_tags
+without the raw tags).
+
+    Welford : running mean and variance per sweep point
+    IQHistogram : fixed-bin 2-D I/Q histogram per sweep point
+    IQStats : both of the above for a pair of I and Q tags, with SNR and
+        readout fidelity estimates
+"""
+import math
+import numpy as np
+
+DEFAULT_BINS = 50
+# Half width of the automatic histogram range, in standard deviations of the
+# first batch
+RANGE_STDS = 6
+
+class Welford:
+    """
+    Running mean and variance per sweep point, combined batch by batch with
+    the parallel form of Welford's algorithm.
+    """
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.count = 0
+        self.mean = None
+        self._m2 = None
+
+    def update(self, batch):
+        """
+        Adds a batch of repetitions, stacked along the first axis.
+        """
+        batch = np.asarray(batch, dtype=float)
+        n_new = batch.shape[0]
+        if n_new == 0:
+            return
+        batch_mean = batch.mean(axis=0)
+        batch_m2 = ((batch - batch_mean) ** 2).sum(axis=0)
+        if self.mean is None:
+            self.count, self.mean, self._m2 = n_new, batch_mean, batch_m2
+            return
+        count = self.count + n_new
+        delta = batch_mean - self.mean
+        self.mean = self.mean + delta * (n_new / count)
+        self._m2 = self._m2 + batch_m2 + delta ** 2 * (self.count * n_new / count)
+        self.count = count
+
+    def variance(self, ddof: int = 1):
+        if self.count <= ddof:
+            return None
+        return self._m2 / (self.count - ddof)
+
+    def std(self, ddof: int = 1):
+        variance = self.variance(ddof)
+        return None if variance is None else np.sqrt(variance)
+
+    def sem(self):
+        """
+        Standard error of the mean.
+        """
+        std = self.std()
+        return None if std is None else std / np.sqrt(self.count)
+
+class IQHistogram:
+    """
+    Fixed-bin 2-D histogram of I and Q per sweep point. Shots outside the
+    range are counted in outliers.
+    """
+    def __init__(self, bins: int = DEFAULT_BINS, iq_range = None):
+        """
+        Arguments:
+            bins (int) : number of bins along I and along Q
+            iq_range : ((i_min, i_max), (q_min, q_max)), by default the means
+                of the first batch +- RANGE_STDS of its standard deviations
+        """
+        self.bins = bins
+        self._fixed_range = iq_range
+        self.reset()
+
+    def reset(self):
+        self.range = self._fixed_range
+        self.counts = None
+        self.outliers = 0
+
+    def _auto_range(self, i_batch, q_batch):
+        center = complex(i_batch.mean(), q_batch.mean())
+        half_width = RANGE_STDS * max(i_batch.std(), q_batch.std(), 1e-12)
+        return ((center.real - half_width, center.real + half_width),
+                (center.imag - half_width, center.imag + half_width))
+
+    def edges(self):
+        """
+        Returns the bin edges along I and along Q.
+        """
+        (i_min, i_max), (q_min, q_max) = self.range
+        return (np.linspace(i_min, i_max, self.bins + 1),
+                np.linspace(q_min, q_max, self.bins + 1))
+
+    def update(self, i_batch, q_batch):
+        """
+        Adds a batch of repetitions of I and Q, stacked along the first axis.
+        """
+        i_batch = np.asarray(i_batch, dtype=float)
+        q_batch = np.asarray(q_batch, dtype=float)
+        if i_batch.shape[0] == 0:
+            return
+        if self.range is None:
+            self.range = self._auto_range(i_batch, q_batch)
+        sweep_shape = i_batch.shape[1:]
+        if self.counts is None:
+            self.counts = np.zeros(sweep_shape + (self.bins, self.bins),
+                                   dtype=np.int64)
+
+        (i_min, i_max), (q_min, q_max) = self.range
+        i_bin = np.floor((i_batch - i_min) * (self.bins / (i_max - i_min)))
+        q_bin = np.floor((q_batch - q_min) * (self.bins / (q_max - q_min)))
+        valid = (i_bin >= 0) & (i_bin < self.bins) \
+                & (q_bin >= 0) & (q_bin < self.bins)
+        self.outliers += int(valid.size - np.count_nonzero(valid))
+
+        point = np.broadcast_to(
+            np.arange(int(np.prod(sweep_shape))).reshape(sweep_shape),
+            i_batch.shape)
+        index = ((point[valid] * self.bins + i_bin[valid].astype(np.intp))
+                 * self.bins + q_bin[valid].astype(np.intp))
+        counts = self.counts.reshape(-1)
+        if 8 * index.size > counts.size:
+            counts += np.bincount(index, minlength=counts.size)
+        else:
+            # cheaper than a full size bincount for small batches
+            np.add.at(counts, index, 1)
+
+class IQStats:
+    """
+    Streaming statistics of a pair of single-shot I and Q result tags.
+    """
+    def __init__(self, i_tag: str = 'I', q_tag: str = 'Q',
+                 bins: int = DEFAULT_BINS, iq_range = None):
+        """
+        Arguments:
+            i_tag, q_tag (str) : result tags of the single shot I and Q
+            bins, iq_range : see IQHistogram, bins=None disables the histogram
+        """
+        self.i_tag = i_tag
+        self.q_tag = q_tag
+        self.i = Welford()
+        self.q = Welford()
+        self.histogram = IQHistogram(bins, iq_range) if bins else None
+
+    def reset(self):
+        self.i.reset()
+        self.q.reset()
+        if self.histogram is not None:
+            self.histogram.reset()
+
+    def update(self, batches: dict):
+        """
+        Adds the new rows of a dict of result tag to batch, as passed by
+        Measurement.results(). Batches without the I and Q tags are ignored.
+        """
+        if self.i_tag not in batches or self.q_tag not in batches:
+            return
+        self.i.update(batches[self.i_tag])
+        self.q.update(batches[self.q_tag])
+        if self.histogram is not None:
+            self.histogram.update(batches[self.i_tag], batches[self.q_tag])
+
+    @property
+    def count(self):
+        return self.i.count
+
+    @property
+    def mean(self):
+        """
+        Mean of I + iQ per sweep point.
+        """
+        if self.i.mean is None:
+            return None
+        return self.i.mean + 1j * self.q.mean
+
+    def spread(self):
+        """
+        Standard deviation of the shots around the mean per sweep point, per
+        quadrature (root of the average of the I and Q variances).
+        """
+        if self.count < 2:
+            return None
+        return np.sqrt((self.i.variance() + self.q.variance()) / 2)
+
+    def snr(self):
+        """
+        |mean| / spread per sweep point.
+        """
+        if self.count < 2:
+            return None
+        return np.abs(self.mean) / self.spread()
+
+    def separation(self, point_a, point_b):
+        """
+        Compares the shot distributions of two sweep points, e.g. the qubit
+        prepared in g and in e, assuming they are gaussian.
+
+        Arguments:
+            point_a, point_b : indices of the two sweep points in the sweep
+                shape
+
+        Returns: (snr, fidelity), the distance between the two means over the
+        average spread and the assignment fidelity 1 - (P(b|a) + P(a|b)) / 2
+        of a threshold halfway between the means.
+        """
+        if self.count < 2:
+            return None
+        mean, spread = self.mean, self.spread()
+        distance = abs(mean[point_a] - mean[point_b])
+        spread_a, spread_b = spread[point_a], spread[point_b]
+        snr = distance / ((spread_a + spread_b) / 2)
+        error_a = .5 * math.erfc(distance / 2 / spread_a / math.sqrt(2))
+        error_b = .5 * math.erfc(distance / 2 / spread_b / math.sqrt(2))
+        return float(snr), float(1 - (error_a + error_b) / 2)
+
+    def to_dict(self) -> dict:
+        """
+        Returns the statistics as a dict that can be written to hdf5.
+        """
+        stats = {'count': self.count, 'mean_I': self.i.mean,
+                 'mean_Q': self.q.mean, 'var_I': self.i.variance(),
+                 'var_Q': self.q.variance()}
+        if self.histogram is not None and self.histogram.counts is not None:
+            i_edges, q_edges = self.histogram.edges()
+            stats.update({'histogram': self.histogram.counts,
+                          'histogram_I_edges': i_edges,
+                          'histogram_Q_edges': q_edges,
+                          'histogram_outliers': self.histogram.outliers})
+        return stats
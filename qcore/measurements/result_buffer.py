@@ -0,0 +1,110 @@
+"""
+Growable array buffer used by Measurement to accumulate fetched results.
+
+Appending to a ResultBuffer is amortized O(batch): the underlying ndarray is
+preallocated (or grown by doubling its capacity) and batches are copied into
+the free region. The filled region is exposed as a zero-copy view.
+"""
+import numpy as np
+
+class ResultBuffer:
+    """
+    Array buffer that grows along its first axis.
+
+    The shot shape and dtype are taken from the first appended batch unless
+    given explicitly. Views returned by data stay valid after later appends,
+    since the region they cover is never written again; growing or trimming
+    the buffer moves the data into a newly allocated array.
+    """
+    def __init__(self, capacity: int = 0, maxlen: int = None,
+                 shot_shape: tuple = None, dtype = None):
+        """
+        Arguments:
+            capacity (int) : number of rows to preallocate, e.g. the expected
+                total number of fetched datapoints
+            maxlen (int) : if given, only the last maxlen rows are kept
+            shot_shape (tuple) : shape of a single row
+            dtype : numpy dtype of the stored values
+        """
+        if maxlen is not None:
+            capacity = min(capacity, 2 * maxlen)
+        self._capacity = capacity
+        self._maxlen = maxlen
+        self._array = None
+        self._start = 0
+        self._stop = 0
+        if shot_shape is not None:
+            self._allocate(tuple(shot_shape), dtype)
+
+    def __len__(self):
+        return self._stop - self._start
+
+    def __array__(self, dtype = None):
+        if dtype is None:
+            return self.data
+        return self.data.astype(dtype)
+
+    @property
+    def data(self):
+        """
+        Zero-copy view of the filled region of the buffer.
+        """
+        if self._array is None:
+            return np.array([])
+        return self._array[self._start:self._stop]
+
+    @property
+    def shape(self):
+        return self.data.shape
+
+    @property
+    def capacity(self):
+        return self._capacity
+
+    def _allocate(self, shot_shape, dtype):
+        self._array = np.empty((self._capacity,) + shot_shape, dtype=dtype)
+
+    def append(self, batch):
+        """
+        Copy a batch of rows (stacked along the first axis) into the buffer.
+        """
+        batch = np.asarray(batch)
+        if self._array is None:
+            self._capacity = max(self._capacity, batch.shape[0])
+            if self._maxlen is not None:
+                self._capacity = min(self._capacity, 2 * self._maxlen)
+            self._allocate(batch.shape[1:], batch.dtype)
+
+        n_new = batch.shape[0]
+        if self._maxlen is not None and n_new >= self._maxlen:
+            # The batch alone fills the buffer, previous rows are dropped.
+            # It is written after them, not over them, as they may be viewed.
+            self._start = self._stop
+            batch = batch[-self._maxlen:]
+            n_new = batch.shape[0]
+
+        if self._stop + n_new > self._capacity:
+            self._reserve(n_new)
+
+        self._array[self._stop:self._stop + n_new] = batch
+        self._stop += n_new
+        if self._maxlen is not None and len(self) > self._maxlen:
+            self._start = self._stop - self._maxlen
+
+    def _reserve(self, n_new):
+        """
+        Makes room for n_new rows after the filled region.
+        """
+        n_kept = len(self)
+        if self._maxlen is not None:
+            n_kept = min(n_kept, self._maxlen)
+            capacity = max(self._capacity, 2 * self._maxlen)
+        else:
+            capacity = max(2 * self._capacity, n_kept + n_new)
+        new_array = np.empty((capacity,) + self._array.shape[1:],
+                             dtype=self._array.dtype)
+        new_array[:n_kept] = self._array[self._stop - n_kept:self._stop]
+        self._array = new_array
+        self._capacity = capacity
+        self._start = 0
+        self._stop = n_kept
@@ -9,6 +9,7 @@ import numpy as np
 import itertools
 
 from measurements.measurement import Measurement
+from measurements.sweep_grid import SweepGrid
 from parameter import Parameter
 from qm.qua import *
 
@@ -41,8 +42,9 @@ class PowerRabi(Measurement):
             [type]: QUA script for power rabi experiment.
         """
 
-        # Defines buffer size for averaging
-        qu_a_buf = len(self._qubit_ascale.value)
+        # Sweep over which QUA iterates
+        self._sweep_grid = SweepGrid([('qubit_ascale', self._qubit_ascale.value)])
+        grid = self._sweep_grid
         
         with program() as power_rabi:
             # Iteration variable
@@ -52,7 +54,7 @@ class PowerRabi(Measurement):
             qu_a = declare(fixed)
             
             # Arrays for sweeping
-            qu_a_vec = declare(fixed, value=self._qubit_ascale.value)
+            qu_a_vec = declare(fixed, value=grid.qua_array('qubit_ascale'))
             
             # Outputs
             I = declare(fixed)
@@ -82,10 +84,10 @@ class PowerRabi(Measurement):
                     save(Q, Q_st) 
                         
             with stream_processing():
-                I_st_avg.buffer(qu_a_buf).average().save_all('I_avg')
-                Q_st_avg.buffer(qu_a_buf).average().save_all('Q_avg')
-                I_st.buffer(qu_a_buf).save_all('I')
-                Q_st.buffer(qu_a_buf).save_all('Q')
+                I_st_avg.buffer(*grid.shape).average().save_all('I_avg')
+                Q_st_avg.buffer(*grid.shape).average().save_all('Q_avg')
+                I_st.buffer(*grid.shape).save_all('I')
+                Q_st.buffer(*grid.shape).save_all('Q')
 
         self._result_tags = ['I', 'Q', 'I_avg', 'Q_avg']
 
@@ -9,6 +9,7 @@ import numpy as np
 import itertools
 
 from measurements.measurement import Measurement
+from measurements.sweep_grid import SweepGrid
 from parameter import Parameter
 from qm.qua import *
 
@@ -41,8 +42,9 @@ class QubitT2(Measurement):
             [type]: QUA script for power rabi experiment.
         """
 
-        # Defines buffer size for averaging
-        tau_buf = len(self._tau.value)
+        # Sweep over which QUA iterates
+        self._sweep_grid = SweepGrid([('tau', self._tau.value, int)])
+        grid = self._sweep_grid
         
         with program() as qubit_T2:
             # Iteration variable
@@ -54,7 +56,7 @@ class QubitT2(Measurement):
             rr_a = declare(fixed, value = self._rr_ascale.value)
 
             # Arrays for sweeping
-            tau = declare(int, value=self._tau.value)
+            tau = declare(int, value=grid.qua_array('tau'))
             
             # Outputs
             I = declare(fixed)
@@ -86,10 +88,10 @@ class QubitT2(Measurement):
                     save(Q, Q_st) 
                                             
             with stream_processing():
-                I_st_avg.buffer(tau_buf).average().save_all('I_avg')
-                Q_st_avg.buffer(tau_buf).average().save_all('Q_avg')
-                I_st.buffer(tau_buf).save_all('I')
-                Q_st.buffer(tau_buf).save_all('Q')
+                I_st_avg.buffer(*grid.shape).average().save_all('I_avg')
+                Q_st_avg.buffer(*grid.shape).average().save_all('Q_avg')
+                I_st.buffer(*grid.shape).save_all('I')
+                Q_st.buffer(*grid.shape).save_all('Q')
 
         self._result_tags = ['I', 'Q', 'I_avg', 'Q_avg']
 
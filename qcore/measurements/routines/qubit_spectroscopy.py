@@ -9,6 +9,7 @@ import numpy as np
 import itertools
 
 from measurements.measurement import Measurement
+from measurements.sweep_grid import SweepGrid
 from parameter import Parameter
 from qm.qua import *
 
@@ -41,21 +42,10 @@ class QubitSpectroscopy(Measurement):
             [type]: QUA script for qubit spectroscopy experiment.
         """
 
-        # Rearranges the input parameters in arrays over which QUA can 
-        # iterate. The arrays are given in the order of outer to inner
-        # loop.
-        parameter_list = [(x.flatten()) 
-                          for x in np.meshgrid(self._qubit_ascale.value,
-                                               self._qubit_f.value,
-                                               indexing = 'ij')]
-        
-        # Names each parameter list and converts types when necessary
-        qu_a_vec_py = parameter_list[0]
-        qu_f_vec_py = [int(x) for x in parameter_list[1]]
-        
-        # Defines buffer size for averaging
-        qu_a_buf = len(self._qubit_ascale.value)
-        qu_f_buf = len(self._qubit_f.value)
+        # Sweep over which QUA iterates, axes given from outer to inner loop.
+        self._sweep_grid = SweepGrid([('qubit_ascale', self._qubit_ascale.value),
+                                      ('qubit_f', self._qubit_f.value, int)])
+        grid = self._sweep_grid
         
         with program() as qubit_spec:
             # Iteration variable
@@ -66,8 +56,8 @@ class QubitSpectroscopy(Measurement):
             qu_f = declare(int)
             
             # Arrays for sweeping
-            qu_a_vec = declare(fixed, value=qu_a_vec_py)
-            qu_f_vec = declare(int, value=qu_f_vec_py)
+            qu_a_vec = declare(fixed, value=grid.qua_array('qubit_ascale'))
+            qu_f_vec = declare(int, value=grid.qua_array('qubit_f'))
             
             # Outputs
             I = declare(fixed)
@@ -97,10 +87,10 @@ class QubitSpectroscopy(Measurement):
                     save(Q, Q_st) 
                           
             with stream_processing():
-                I_st_avg.buffer(qu_a_buf, qu_f_buf).average().save_all('I_avg')
-                Q_st_avg.buffer(qu_a_buf, qu_f_buf).average().save_all('Q_avg')
-                I_st.buffer(qu_a_buf, qu_f_buf).save_all('I')
-                Q_st.buffer(qu_a_buf, qu_f_buf).save_all('Q')
+                I_st_avg.buffer(*grid.shape).average().save_all('I_avg')
+                Q_st_avg.buffer(*grid.shape).average().save_all('Q_avg')
+                I_st.buffer(*grid.shape).save_all('I')
+                Q_st.buffer(*grid.shape).save_all('Q')
 
         self._result_tags = ['I', 'Q', 'I_avg', 'Q_avg']
 
@@ -9,6 +9,7 @@ import numpy as np
 import itertools
 
 from measurements.measurement import Measurement
+from measurements.sweep_grid import SweepGrid
 from parameter import Parameter
 from qm.qua import *
 
@@ -48,24 +49,11 @@ class ResonatorSpectroscopy(Measurement):
             print('ERROR: Define the qubit pulse amplitude scaling.')
             return
 
-        # Rearranges the input parameters in arrays over which QUA can 
-        # iterate. The arrays are given in the order of outer to inner
-        # loop.
-        parameter_list = [(x.flatten()) 
-                          for x in np.meshgrid(self._qubit_ascale.value,
-                                               self._rr_ascale.value, 
-                                               self._rr_f.value,
-                                               indexing = 'ij')]
-        
-        # Names each parameter list and converts types when necessary
-        qu_a_vec_py = parameter_list[0]
-        rr_a_vec_py = parameter_list[1]
-        rr_f_vec_py = [int(x) for x in parameter_list[2]]
-        
-        # Defines buffer size for averaging
-        qu_a_buf = len(self._qubit_ascale.value)
-        rr_a_buf = len(self._rr_ascale.value)
-        rr_f_buf = len(self._rr_f.value)
+        # Sweep over which QUA iterates, axes given from outer to inner loop.
+        self._sweep_grid = SweepGrid([('qubit_ascale', self._qubit_ascale.value),
+                                      ('rr_ascale', self._rr_ascale.value),
+                                      ('rr_f', self._rr_f.value, int)])
+        grid = self._sweep_grid
         
         with program() as rr_spec:
             # Iteration variable
@@ -77,9 +65,9 @@ class ResonatorSpectroscopy(Measurement):
             rr_f = declare(int)
             
             # Arrays for sweeping
-            qu_a_vec = declare(fixed, value=qu_a_vec_py)
-            rr_a_vec = declare(fixed, value=rr_a_vec_py)
-            rr_f_vec = declare(int, value=rr_f_vec_py)
+            qu_a_vec = declare(fixed, value=grid.qua_array('qubit_ascale'))
+            rr_a_vec = declare(fixed, value=grid.qua_array('rr_ascale'))
+            rr_f_vec = declare(int, value=grid.qua_array('rr_f'))
             
             # Outputs
             I = declare(fixed)
@@ -109,10 +97,10 @@ class ResonatorSpectroscopy(Measurement):
                     save(Q, Q_st) 
                           
             with stream_processing():
-                I_st_avg.buffer(qu_a_buf, rr_a_buf, rr_f_buf).average().save_all('I_avg')
-                Q_st_avg.buffer(qu_a_buf, rr_a_buf, rr_f_buf).average().save_all('Q_avg')
-                I_st.buffer(qu_a_buf, rr_a_buf, rr_f_buf).save_all('I')
-                Q_st.buffer(qu_a_buf, rr_a_buf, rr_f_buf).save_all('Q')
+                I_st_avg.buffer(*grid.shape).average().save_all('I_avg')
+                Q_st_avg.buffer(*grid.shape).average().save_all('Q_avg')
+                I_st.buffer(*grid.shape).save_all('I')
+                Q_st.buffer(*grid.shape).save_all('Q')
 
         self._result_tags = ['I', 'Q', 'I_avg', 'Q_avg']
 
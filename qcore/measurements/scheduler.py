@@ -0,0 +1,231 @@
+"""
+Scheduler running a batch of measurements that pipelines compile, queue and
+fetch.
+
+While a job executes, the scheduler builds the QUA program of the next ready
+measurement on a compile thread and queues it as soon as it is built, so the
+QM queue is not left empty between jobs. Results of running jobs are fetched
+(and streamed to their sinks) on a fetch thread. A measurement only becomes
+ready once the measurements it depends on have concluded, been fetched and
+had their on_done callback run, e.g. to update its parameters from a fit.
+"""
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Stages timed for every measurement, see MeasurementScheduler.timings
+STAGES = ('compile', 'queue', 'execution', 'fetch')
+
+# Entry states
+WAITING, COMPILING, COMPILED, QUEUED, RUNNING, FETCHING = \
+    'waiting', 'compiling', 'compiled', 'queued', 'running', 'fetching'
+DONE, FAILED, SKIPPED = 'done', 'failed', 'skipped'
+FINAL_STATES = (DONE, FAILED, SKIPPED)
+
+class MeasurementScheduler:
+    """
+    Runs measurements sharing one quantum machine in dependency order.
+
+    Usage:
+        scheduler = MeasurementScheduler()
+        scheduler.add(rr_spec)
+        scheduler.add(qubit_spec, depends_on=[rr_spec], on_done=update_qubit_f)
+        scheduler.add(t1, depends_on=[qubit_spec])
+        scheduler.add(t2, depends_on=[qubit_spec])
+        timings = scheduler.run()
+    """
+    def __init__(self, queue_depth: int = 2, lookahead: int = 1,
+                 poll_interval: float = 0.05, fetch_interval: float = 0.5):
+        """
+        Arguments:
+            queue_depth (int) : maximum number of jobs queued or in execution
+                at the same time, 2 keeps one job waiting behind the running one
+            lookahead (int) : maximum number of programs built but not queued
+            poll_interval (float) : seconds between two passes of the scheduler
+            fetch_interval (float) : seconds between two fetches of partial
+                results of a running job
+        """
+        self.queue_depth = queue_depth
+        self.lookahead = lookahead
+        self.poll_interval = poll_interval
+        self.fetch_interval = fetch_interval
+        self._entries = []
+        self.timings = {}
+        self.errors = {}
+
+    def add(self, measurement, depends_on = (), on_done = None):
+        """
+        Adds a measurement to the batch. Measurements are queued in the order
+        they were added among those that are ready.
+
+        Arguments:
+            measurement (Measurement) : measurement to run
+            depends_on : measurements (already added) that must be done first
+            on_done : callable(measurement) run after the final fetch
+        """
+        known = [entry['measurement'] for entry in self._entries]
+        for dependency in depends_on:
+            if not any(dependency is m for m in known):
+                raise ValueError('Dependency %s was not added to the scheduler.'
+                                 % dependency._name)
+        self._entries.append({'measurement': measurement,
+                              'depends_on': list(depends_on),
+                              'on_done': on_done,
+                              'state': WAITING,
+                              'future': None,
+                              'program': None,
+                              'times': {}})
+
+    def _entry_of(self, measurement):
+        return next(entry for entry in self._entries
+                    if entry['measurement'] is measurement)
+
+    def _count(self, *states):
+        return sum(entry['state'] in states for entry in self._entries)
+
+    def _fail(self, entry, error):
+        entry['state'] = FAILED
+        self.errors[entry['measurement']._name] = error
+        print('Measurement %s failed: %r' % (entry['measurement']._name, error))
+
+    def _final_fetch(self, entry):
+        measurement = entry['measurement']
+        measurement.results()
+        if entry['on_done'] is not None:
+            entry['on_done'](measurement)
+
+    def _step(self, entry, compiler, fetcher):
+        """
+        Advances entry by at most one state. Returns True if it changed state.
+        """
+        state, times = entry['state'], entry['times']
+        measurement = entry['measurement']
+        now = time.monotonic()
+
+        if state == WAITING:
+            dependencies = [self._entry_of(m) for m in entry['depends_on']]
+            if any(dep['state'] in (FAILED, SKIPPED) for dep in dependencies):
+                entry['state'] = SKIPPED
+                return True
+            if all(dep['state'] == DONE for dep in dependencies) \
+                    and self._count(COMPILING, COMPILED) < self.lookahead:
+                times['ready'] = times['compile_start'] = now
+                entry['future'] = compiler.submit(measurement._script)
+                entry['state'] = COMPILING
+                return True
+
+        elif state == COMPILING and entry['future'].done():
+            times['compile_end'] = now
+            try:
+                entry['program'] = entry['future'].result()
+            except Exception as error:
+                self._fail(entry, error)
+                return True
+            entry['future'] = None
+            entry['state'] = COMPILED
+            return True
+
+        elif state == COMPILED \
+                and self._count(QUEUED, RUNNING) < self.queue_depth:
+            try:
+                measurement.queue_job(entry['program'])
+            except Exception as error:
+                self._fail(entry, error)
+                return True
+            entry['program'] = None
+            times['queued'] = time.monotonic()
+            entry['state'] = QUEUED
+            return True
+
+        elif state in (QUEUED, RUNNING):
+            fetching = entry['future'] is not None \
+                       and not entry['future'].done()
+            handle = measurement.job_handle
+            status = handle.status()
+            # estimated from the status changes seen by the handle, as a
+            # short job may start and conclude between two passes
+            started, concluded = handle.execution_window()
+            if state == QUEUED and status != 'queued':
+                if started is None:
+                    # cancelled before it started
+                    started = concluded if concluded is not None else now
+                times['started'] = max(started, times['queued'])
+                entry['state'] = RUNNING
+            if status in ('concluded', 'cancelled') and not fetching:
+                times['concluded'] = max(concluded, times['started']) \
+                                     if concluded is not None else now
+                entry['future'] = fetcher.submit(self._final_fetch, entry)
+                entry['state'] = FETCHING
+            elif entry['state'] == RUNNING and not fetching \
+                    and now - times.get('fetched', times['started']) \
+                        >= self.fetch_interval:
+                # partial results go to the sink while the job executes
+                times['fetched'] = now
+                entry['future'] = fetcher.submit(measurement.results)
+            return entry['state'] != state
+
+        elif state == FETCHING and entry['future'].done():
+            times['fetch_end'] = now
+            try:
+                entry['future'].result()
+            except Exception as error:
+                self._fail(entry, error)
+                return True
+            entry['future'] = None
+            entry['state'] = DONE
+            return True
+
+        return False
+
+    def run(self):
+        """
+        Runs all added measurements.
+
+        Returns: dict of measurement name to dict of the seconds spent in
+        every stage of STAGES ('queue' is the wait in the QM queue), and the
+        'total' item with the wall time and the 'duty_cycle', fraction of the
+        wall time during which a job was executing. Measurements that failed
+        (see self.errors) or depend on one that failed are left out.
+        """
+        start = time.monotonic()
+        with ThreadPoolExecutor(1) as compiler, ThreadPoolExecutor(1) as fetcher:
+            while self._count(*FINAL_STATES) < len(self._entries):
+                progressed = False
+                for entry in self._entries:
+                    progressed |= self._step(entry, compiler, fetcher)
+                if not progressed:
+                    time.sleep(self.poll_interval)
+        wall_time = time.monotonic() - start
+
+        self.timings = {}
+        execution_time = 0.
+        for entry in self._entries:
+            if entry['state'] != DONE:
+                continue
+            times = entry['times']
+            stage_times = {
+                'compile': times['compile_end'] - times['compile_start'],
+                'queue': times['started'] - times['queued'],
+                'execution': times['concluded'] - times['started'],
+                'fetch': times['fetch_end'] - times['concluded'],
+                }
+            execution_time += stage_times['execution']
+            self.timings[entry['measurement']._name] = stage_times
+        self.timings['total'] = {'wall_time': wall_time,
+                                 'duty_cycle': execution_time / wall_time
+                                               if wall_time else 0.}
+        return self.timings
+
+    def report(self):
+        """
+        Prints the per-stage timings of the last run.
+        """
+        print('%-24s' % 'measurement' + ''.join('%12s' % s for s in STAGES))
+        for name, stage_times in self.timings.items():
+            if name == 'total':
+                continue
+            print('%-24s' % name + ''.join('%11.3fs' % stage_times[s]
+                                           for s in STAGES))
+        total = self.timings.get('total', {})
+        if total:
+            print('wall time %.3fs, duty cycle %.0f%%'
+                  % (total['wall_time'], 100 * total['duty_cycle']))
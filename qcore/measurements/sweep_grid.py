@@ -0,0 +1,100 @@
+"""
+N-dimensional sweep grid shared by the measurement routines.
+
+A SweepGrid holds the swept values of every axis, from the outer to the inner
+loop. It gives the buffer shape of the stream processing, the flattened
+per-point arrays QUA iterates over with for_each_ (converted to the QUA type
+in one vectorised step) and reshapes flat result streams back to one N-D
+array per repetition without copying.
+"""
+import numpy as np
+
+class SweepGrid:
+    """
+    Grid of sweep points, axes ordered from the outer to the inner loop.
+
+    Usage (see ResonatorSpectroscopy):
+        grid = SweepGrid([('qubit_ascale', qubit_ascales),
+                          ('rr_ascale', rr_ascales),
+                          ('rr_f', rr_fs, int)])
+        rr_f_vec = declare(int, value=grid.qua_array('rr_f'))
+        I_st.buffer(*grid.shape).save_all('I')
+        I = grid.reshape(I_flat)
+    """
+    def __init__(self, axes):
+        """
+        Arguments:
+            axes : list of (name, values) or (name, values, dtype), from the
+                outer to the inner loop. A scalar value is a sweep of one
+                point. dtype is the python type of the QUA variable, float by
+                default, int for e.g. frequencies and times (values are
+                truncated like int() does).
+        """
+        self._axes = {}
+        for axis in axes:
+            name, values = axis[0], axis[1]
+            dtype = axis[2] if len(axis) > 2 else float
+            values = np.atleast_1d(np.asarray(values))
+            if values.ndim != 1:
+                raise ValueError('Values of sweep axis %s must be 1-D.' % name)
+            if name in self._axes:
+                raise ValueError('Sweep axis %s is given twice.' % name)
+            self._axes[name] = values.astype(dtype)
+        self.shape = tuple(len(values) for values in self._axes.values())
+        self.size = int(np.prod(self.shape))
+        self._qua_arrays = {}
+
+    def __repr__(self):
+        return 'SweepGrid({})'.format(', '.join(
+            '{}: {}'.format(name, len(values))
+            for name, values in self._axes.items()))
+
+    @property
+    def names(self):
+        return list(self._axes)
+
+    def axis(self, name: str) -> int:
+        """
+        Returns the position of axis name in shape.
+        """
+        return self.names.index(name)
+
+    def values(self, name: str):
+        """
+        Returns the swept values of axis name.
+        """
+        return self._axes[name]
+
+    def flat(self, name: str):
+        """
+        Returns the value of axis name at every point of the grid, in loop
+        order (inner axis fastest).
+        """
+        i = self.axis(name)
+        outer = int(np.prod(self.shape[:i]))
+        inner = int(np.prod(self.shape[i + 1:]))
+        return np.tile(np.repeat(self._axes[name], inner), outer)
+
+    def qua_array(self, name: str) -> list:
+        """
+        Returns flat(name) as a list of python scalars, to be declared as a
+        QUA array.
+        """
+        if name not in self._qua_arrays:
+            self._qua_arrays[name] = self.flat(name).tolist()
+        return self._qua_arrays[name]
+
+    def coords(self) -> dict:
+        """
+        Returns the dict of axis name to swept values, e.g. to be saved next
+        to the results.
+        """
+        return dict(self._axes)
+
+    def reshape(self, data):
+        """
+        Returns data, a stream of whole sweeps (flat, or one row or buffer per
+        repetition), as an array of shape (repetitions,) + shape. This is a
+        view of data if data is contiguous.
+        """
+        return np.asarray(data).reshape((-1,) + self.shape)
@@ -0,0 +1,269 @@
+"""
+Module for the bulk export of hdf5 run files to columnar formats.
+
+"export_tree" converts every ".hdf5" file below a data directory, in parallel
+with a process pool, to either
+    "npz" : one .npz archive per run. Every dataset becomes the entry
+        "<dataset path>.npy" and every attribute the 0-d entry
+        "<group or dataset path>@<attribute name>.npy".
+    "parquet" : one directory per run with a parquet file per dataset
+        ("/" in the dataset path replaced by "__") and the attributes in
+        "attrs.json". Needs pyarrow.
+Datasets are copied in chunks of about chunk_bytes, so whole files are never
+loaded in memory. Runs whose output is newer than the run file are skipped.
+Snapshots are not exported: the external links of the run files to them are
+not followed, and directories holding a NO_RUNS_MARKER file (such as the
+snapshot store) are skipped.
+
+From the command line (with PYTHONPATH=./qcore):
+    python -m result.export <datadir> <outdir> [--format npz|parquet] [--processes N]
+"""
+import argparse
+import io
+import json
+import os
+import shutil
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+import h5py
+import numpy as np
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+from result.run_catalog import NO_RUNS_MARKER
+
+EXPORT_FORMATS = ("npz", "parquet")
+DEFAULT_CHUNK_BYTES = 16 * 1024 * 1024
+
+def _iter_slices(dset, chunk_bytes: int):
+    """
+    Yields slices along the first axis of dset, each about chunk_bytes large.
+    """
+    if dset.shape == ():
+        yield ()
+        return
+    row_bytes = dset.dtype.itemsize * int(np.prod(dset.shape[1:]))
+    rows = max(1, chunk_bytes // max(row_bytes, 1))
+    if dset.chunks is not None:
+        # whole hdf5 chunks avoid decompressing chunks twice
+        rows = max(dset.chunks[0], rows // dset.chunks[0] * dset.chunks[0])
+    for start in range(0, dset.shape[0], rows):
+        yield slice(start, min(start + rows, dset.shape[0]))
+
+def _plain_array(data):
+    """
+    Converts the variable length strings (object fields) h5py returns to
+    fixed size numpy unicode, which npz and arrow can store.
+    """
+    data = np.asarray(data)
+    if data.dtype.names is not None:
+        fields = [(name, _plain_array(data[name])) for name in data.dtype.names]
+        plain = np.empty(data.shape, dtype=[(name, field.dtype) for name, field in fields])
+        for name, field in fields:
+            plain[name] = field
+        return plain
+    if data.dtype.hasobject:
+        values = [x.decode("utf-8") if isinstance(x, bytes) else x for x in data.flat]
+        return np.array(values, dtype=str).reshape(data.shape)
+    return data
+
+def _attr_value(value):
+    if isinstance(value, bytes):
+        value = value.decode("utf-8")
+    return _plain_array(value)
+
+def _iter_items(f):
+    """
+    Returns (path, hdf5 object) for the root and every group and dataset of f.
+    """
+    items = [("", f)]
+    f.visititems(lambda name, item: items.append((name, item)))
+    return items
+
+def _write_npy_entry(zf, name: str, dset, chunk_bytes: int):
+    if dset.dtype.hasobject:
+        # variable length data has no fixed item size, it is converted at once
+        buffer = io.BytesIO()
+        np.save(buffer, _plain_array(dset[()]))
+        zf.writestr(name, buffer.getvalue())
+        return
+    header = {"descr": np.lib.format.dtype_to_descr(dset.dtype),
+              "fortran_order": False, "shape": dset.shape}
+    with zf.open(name, "w", force_zip64=True) as fh:
+        np.lib.format.write_array_header_2_0(fh, header)
+        for sl in _iter_slices(dset, chunk_bytes):
+            fh.write(np.ascontiguousarray(dset[sl]).tobytes())
+
+def _remove_tmp(tmp_path: str):
+    """
+    Removes the partial output of a failed export.
+    """
+    if os.path.isdir(tmp_path):
+        shutil.rmtree(tmp_path, ignore_errors=True)
+    elif os.path.exists(tmp_path):
+        os.remove(tmp_path)
+
+def _export_npz(filepath: str, outpath: str, chunk_bytes: int):
+    tmp_path = outpath + ".tmp"
+    try:
+        with h5py.File(filepath, "r") as f, zipfile.ZipFile(tmp_path, "w", allowZip64=True) as zf:
+            for path, item in _iter_items(f):
+                for attr_name, value in item.attrs.items():
+                    buffer = io.BytesIO()
+                    np.save(buffer, _attr_value(value))
+                    zf.writestr("{}@{}.npy".format(path, attr_name), buffer.getvalue())
+                if isinstance(item, h5py.Dataset):
+                    _write_npy_entry(zf, path + ".npy", item, chunk_bytes)
+    except BaseException:
+        _remove_tmp(tmp_path)
+        raise
+    os.replace(tmp_path, outpath)
+
+def _arrow_table(data):
+    """
+    Converts a chunk of rows to an arrow table, rows of N-D datasets become
+    fixed size lists of the flattened row.
+    """
+    data = _plain_array(data)
+    if data.ndim == 0:
+        data = data.reshape(1)
+    if data.dtype.names is not None:
+        return pa.table({name: pa.array(data[name]) for name in data.dtype.names})
+    if data.ndim == 1:
+        return pa.table({"value": pa.array(data)})
+    row_size = int(np.prod(data.shape[1:]))
+    values = pa.array(data.reshape(-1))
+    return pa.table({"value": pa.FixedSizeListArray.from_arrays(values, row_size)})
+
+def _export_parquet(filepath: str, outpath: str, chunk_bytes: int):
+    tmp_path = outpath + ".tmp"
+    _remove_tmp(tmp_path)
+    os.makedirs(tmp_path)
+    try:
+        attrs = {}
+        with h5py.File(filepath, "r") as f:
+            for path, item in _iter_items(f):
+                if item.attrs:
+                    attrs[path or "/"] = {name: _attr_value(value).tolist()
+                                          for name, value in item.attrs.items()}
+                if not isinstance(item, h5py.Dataset):
+                    continue
+                metadata = {"hdf5_path": path, "shape": json.dumps(item.shape)}
+                writer = None
+                try:
+                    for sl in _iter_slices(item, chunk_bytes):
+                        table = _arrow_table(item[sl])
+                        if writer is None:
+                            schema = table.schema.with_metadata(metadata)
+                            writer = pq.ParquetWriter(
+                                os.path.join(tmp_path, path.replace("/", "__") + ".parquet"), schema)
+                        writer.write_table(table.replace_schema_metadata(metadata))
+                finally:
+                    if writer is not None:
+                        writer.close()
+        with open(os.path.join(tmp_path, "attrs.json"), "w") as fh:
+            json.dump(attrs, fh, default=str)
+    except BaseException:
+        _remove_tmp(tmp_path)
+        raise
+    if os.path.exists(outpath):
+        shutil.rmtree(outpath)
+    os.replace(tmp_path, outpath)
+
+def _export_file(args):
+    """
+    Worker of export_tree, returns (filepath, error message or None).
+    """
+    filepath, outpath, fmt, chunk_bytes = args
+    try:
+        os.makedirs(os.path.dirname(outpath), exist_ok=True)
+        if fmt == "npz":
+            _export_npz(filepath, outpath, chunk_bytes)
+        else:
+            _export_parquet(filepath, outpath, chunk_bytes)
+        return filepath, None
+    except Exception as err:
+        return filepath, "{}: {}".format(type(err).__name__, err)
+
+def _output_path(filepath: str, datadir: str, outdir: str, fmt: str) -> str:
+    relpath = os.path.relpath(filepath, datadir)
+    return os.path.join(outdir, os.path.splitext(relpath)[0] + "." + fmt)
+
+def export_tree(datadir: str, outdir: str, fmt: str = "npz", processes: int = None,
+                chunk_bytes: int = DEFAULT_CHUNK_BYTES) -> dict:
+    """
+    Exports every ".hdf5" file below datadir to outdir, mirroring the directory tree.
+
+    Arguments:
+        datadir (str) : base directory of the run files
+        outdir (str) : directory the exported files are written to
+        fmt (str) : one of EXPORT_FORMATS
+        processes (int) : size of the process pool, defaults to the number of cpus.
+            1 exports in the calling process. Scripts calling this on Windows
+            need an "if __name__ == '__main__'" guard.
+        chunk_bytes (int) : approximate size of the blocks datasets are copied in
+
+    Return:
+        dict with the lists of "exported", "skipped" (output up to date) and
+        "failed" (filepath, error message) run files
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError("Export format `{}` not in {}".format(fmt, EXPORT_FORMATS))
+    if fmt == "parquet" and pq is None:
+        raise ImportError("Exporting to parquet needs pyarrow")
+    datadir = os.path.abspath(datadir)
+    outdir = os.path.abspath(outdir)
+
+    summary = {"exported": [], "skipped": [], "failed": []}
+    jobs = []
+    for root, dirs, files in os.walk(datadir):
+        # outdir itself when it is inside datadir, but not siblings like outdir + "_2"
+        if os.path.commonpath([os.path.abspath(root), outdir]) == outdir \
+                or NO_RUNS_MARKER in files:
+            dirs[:] = []
+            continue
+        dirs.sort()
+        for filename in sorted(files):
+            if not filename.endswith(".hdf5"):
+                continue
+            filepath = os.path.join(root, filename)
+            outpath = _output_path(filepath, datadir, outdir, fmt)
+            if os.path.exists(outpath) and os.path.getmtime(outpath) >= os.path.getmtime(filepath):
+                summary["skipped"].append(filepath)
+            else:
+                jobs.append((filepath, outpath, fmt, chunk_bytes))
+
+    if processes == 1 or len(jobs) <= 1:
+        outputs = map(_export_file, jobs)
+    else:
+        with ProcessPoolExecutor(max_workers=processes) as pool:
+            outputs = list(pool.map(_export_file, jobs, chunksize=8))
+    for filepath, error in outputs:
+        if error is None:
+            summary["exported"].append(filepath)
+        else:
+            summary["failed"].append((filepath, error))
+    return summary
+
+def main():
+    parser = argparse.ArgumentParser(description="Export hdf5 run files to npz or parquet.")
+    parser.add_argument("datadir")
+    parser.add_argument("outdir")
+    parser.add_argument("--format", default="npz", choices=EXPORT_FORMATS)
+    parser.add_argument("--processes", type=int, default=None)
+    args = parser.parse_args()
+
+    start = time.time()
+    summary = export_tree(args.datadir, args.outdir, fmt=args.format, processes=args.processes)
+    print("Exported {}, skipped {}, failed {} run files in {:.1f} s".format(
+        len(summary["exported"]), len(summary["skipped"]), len(summary["failed"]),
+        time.time() - start))
+    for filepath, error in summary["failed"]:
+        print("Failed {}: {}".format(filepath, error))
+
+if __name__ == "__main__":
+    main()
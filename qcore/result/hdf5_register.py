@@ -4,12 +4,40 @@ Based on hdf5 datawrapper from qtlab originally by Reinier Heeres and
 Wolfgang Pfaff and hdf5_data.py from PycQED module.
 @yifan 
 """
+import glob
 import os
+import pickle
+import queue
+import re
+import sqlite3
+import threading
 import time
+from concurrent.futures import ProcessPoolExecutor
 import h5py
 import numpy as np
 import logging as log
-from uncertainties import UFloat
+from collections.abc import Mapping
+from uncertainties import UFloat, unumpy
+try:
+    # registers the blosc/lz4 hdf5 filters used by the "fast" storage profile
+    import hdf5plugin
+except ImportError:
+    hdf5plugin = None
+DEFAULT_CHUNK_SIZE = 1024  # shots per chunk of a streamed dataset
+DEFAULT_FLUSH_INTERVAL = 5.0  # seconds between flushes triggered by DatasetFile.append
+DEFAULT_QUEUE_SIZE = 64  # batches waiting for the DatasetFile writer thread
+
+# Storage profiles of datasets: "raw" is contiguous and uncompressed, "fast"
+# uses blosc/lz4 (gzip level 1 without hdf5plugin), "archive" gzip 9 + shuffle.
+STORAGE_PROFILES = ("raw", "fast", "archive")
+# Target size in bytes of a chunk of whole shots for each compressed profile
+PROFILE_CHUNK_BYTES = {"fast": 256 * 1024, "archive": 1024 * 1024}
+# Target size in bytes of a chunk of a "raw" stream
+RAW_CHUNK_BYTES = 1024 * 1024
+# Largest chunk in bytes, well under the 4 GB limit of HDF5 chunks. Shots larger
+# than this are split across several chunks.
+MAX_CHUNK_BYTES = 64 * 1024 * 1024
+
 ########################################
 #          helper function
 ########################################
@@ -25,6 +53,66 @@ def encode_to_utf8(s):
         s = [s.encode("utf-8") for s in s]
     return s
 
+def chunk_shape(shape: tuple, itemsize: int, chunk_bytes: int, chunk_rows: int = None) -> tuple:
+    """
+    Returns the chunk shape of a dataset of shots stacked along its first axis.
+
+    Arguments:
+        shape (tuple) : shape of the dataset, 0 along the first axis for a stream
+        itemsize (int) : size in bytes of an element
+        chunk_bytes (int) : target size in bytes of a chunk of whole shots
+        chunk_rows (int) : number of shots per chunk instead of the target size
+
+    Chunks hold at least one shot, and a shot larger than MAX_CHUNK_BYTES is
+    split along its outer axes.
+    """
+    shot = [max(int(n), 1) for n in shape[1:]]
+    row_bytes = max(itemsize * int(np.prod(shot)), 1)
+    if chunk_rows is None:
+        chunk_rows = chunk_bytes // row_bytes
+        if shape[0]:
+            chunk_rows = min(chunk_rows, shape[0])
+    chunk_rows = max(1, min(int(chunk_rows), MAX_CHUNK_BYTES // row_bytes))
+    for axis in range(len(shot)):
+        while itemsize * chunk_rows * int(np.prod(shot)) > MAX_CHUNK_BYTES and shot[axis] > 1:
+            shot[axis] = (shot[axis] + 1) // 2
+    return (chunk_rows,) + tuple(shot)
+
+def storage_options(profile: str, shape: tuple, dtype, chunk_rows: int = None,
+                    resizable: bool = False) -> dict:
+    """
+    Returns the create_dataset keyword arguments of a storage profile.
+
+    Arguments:
+        profile (str) : one of STORAGE_PROFILES
+        shape (tuple) : shape of the dataset, shots along the first axis
+        dtype : numpy dtype of the dataset
+        chunk_rows (int) : number of shots per chunk. By default chunks hold whole
+            shots and are about PROFILE_CHUNK_BYTES[profile] large.
+        resizable (bool) : whether the dataset grows along its first axis (a stream)
+    """
+    if profile not in STORAGE_PROFILES:
+        raise ValueError("Storage profile `{}` not in {}".format(profile, STORAGE_PROFILES))
+    dtype = np.dtype(dtype)
+    shape = tuple(shape)
+    # scalars cannot be chunked and filters do not compress variable length data
+    if profile == "raw" or shape == () or dtype.hasobject:
+        return {}
+    # an empty fixed-size dataset has no chunk that fits in it
+    if not resizable and int(np.prod(shape)) == 0:
+        return {}
+
+    options = {"chunks": chunk_shape(shape, dtype.itemsize, PROFILE_CHUNK_BYTES[profile], chunk_rows)}
+
+    if profile == "fast":
+        if hdf5plugin is not None:
+            options.update(hdf5plugin.Blosc(cname="lz4", clevel=5, shuffle=hdf5plugin.Blosc.SHUFFLE))
+        else:
+            options.update(compression="gzip", compression_opts=1)
+    elif profile == "archive":
+        options.update(compression="gzip", compression_opts=9, shuffle=True)
+    return options
+
 def RepresentsInt(s):
     try:
         int(s)
@@ -32,13 +120,172 @@ def RepresentsInt(s):
     except ValueError:
         return False
 
-def write_dict_to_hdf5(data_dict: dict, entry_point, group_overwrite_level: int = np.inf):
+PACKED_SCALARS_KEY = "__packed_scalars__"
+
+def _scalar_dtype(item):
+    """
+    Returns the numpy dtype used to store a scalar in a packed (compound)
+    dataset, or None if the scalar cannot be packed, e.g. an int outside the
+    int64 range, which has no fixed size dtype.
+    """
+    if isinstance(item, (bool, np.bool_)):
+        return np.dtype(np.bool_)
+    elif isinstance(item, (int, float)):
+        dtype = np.asarray(item).dtype
+        return None if dtype.hasobject else dtype
+    elif isinstance(item, np.number):
+        return item.dtype
+    elif isinstance(item, str) or item is None:
+        return h5py.string_dtype()
+    return None
+
+def _to_packed_value(item):
+    return "NoneType:__None__" if item is None else item
+
+def _from_packed_value(value):
+    if isinstance(value, bytes):
+        value = value.decode("utf-8")
+        if value == "NoneType:__None__":
+            value = None
+    return value
+
+def _write_packed_scalars(data_dict: dict, entry_point) -> dict:
+    """
+    Writes all scalars of data_dict as fields of a single compound dataset
+    in entry_point, instead of one attribute per scalar.
+
+    Return:
+        the items of data_dict that were not packed
+    """
+    scalars, remaining = {}, {}
+    for key, item in data_dict.items():
+        if isinstance(key, str) and _scalar_dtype(item) is not None:
+            scalars[key] = item
+        else:
+            remaining[key] = item
+    if not scalars:
+        return remaining
+
+    if PACKED_SCALARS_KEY in entry_point:
+        # merge with the scalars written earlier to the same group
+        old_scalars = _read_packed_scalars(entry_point[PACKED_SCALARS_KEY])
+        old_scalars.update(scalars)
+        scalars = old_scalars
+        del entry_point[PACKED_SCALARS_KEY]
+
+    dtype = np.dtype([(key, _scalar_dtype(item)) for key, item in scalars.items()])
+    packed = np.empty((), dtype=dtype)
+    for key, item in scalars.items():
+        packed[key] = _to_packed_value(item)
+    ds = entry_point.create_dataset(PACKED_SCALARS_KEY, data=packed)
+    ds.attrs["list_type"] = "packed_scalars"
+    return remaining
+
+def _read_packed_scalars(item) -> dict:
+    packed = item[()]
+    return {key: _from_packed_value(packed[key]) for key in packed.dtype.names}
+
+def _is_dict_table(item) -> bool:
+    """
+    Whether item is a non-empty list of dicts with identical string keys and
+    scalar values of identical types, which can be stored as a table.
+    """
+    if not isinstance(item, list) or not item or not isinstance(item[0], dict) or not item[0]:
+        return False
+    keys = list(item[0].keys())
+    if not all(isinstance(key, str) for key in keys):
+        return False
+    dtypes = [_scalar_dtype(item[0][key]) for key in keys]
+    if any(dt is None for dt in dtypes):
+        return False
+    for row in item:
+        if not isinstance(row, dict) or list(row.keys()) != keys:
+            return False
+        if [_scalar_dtype(row[key]) for key in keys] != dtypes:
+            return False
+    return True
+
+def _write_dict_table(key, item: list, entry_point):
+    keys = list(item[0].keys())
+    dtype = np.dtype([(k, _scalar_dtype(item[0][k])) for k in keys])
+    table = np.empty(len(item), dtype=dtype)
+    for k in keys:
+        table[k] = [_to_packed_value(row[k]) for row in item]
+    ds = entry_point.create_dataset(key, data=table)
+    ds.attrs["list_type"] = "dict_table"
+
+def _read_dict_table(item) -> list:
+    table = item[()]
+    return [{k: _from_packed_value(row[k]) for k in table.dtype.names} for row in table]
+
+def _read_str_list(item) -> list:
+    """
+    Reads a list of strings in one call, from a 1-D dataset or from the (N, 1)
+    datasets written by earlier versions of write_dict_to_hdf5.
+    """
+    data = item.asstr()[()]
+    if data.ndim == 2:
+        data = data[:, 0]
+    return data.tolist()
+
+UFLOAT_DTYPE = np.dtype([("nominal_value", np.float64), ("std_dev", np.float64)])
+
+def _is_ufloat_array(item) -> bool:
+    """
+    Whether item is a non-empty list or numpy object array of UFloat.
+    """
+    if isinstance(item, np.ndarray):
+        if item.dtype != object or item.size == 0:
+            return False
+        return all(isinstance(x, UFloat) for x in item.flat)
+    return isinstance(item, list) and len(item) > 0 and all(isinstance(x, UFloat) for x in item)
+
+def _write_ufloat_array(key, item, entry_point, profile: str = "raw"):
+    """
+    Stores an array (or list) of UFloat as a single compound (nominal_value, std_dev) dataset.
+    """
+    nominal_values = unumpy.nominal_values(item)
+    packed = np.empty(nominal_values.shape, dtype=UFLOAT_DTYPE)
+    packed["nominal_value"] = nominal_values
+    packed["std_dev"] = unumpy.std_devs(item)
+    ds = entry_point.create_dataset(key, data=packed, **storage_options(profile, packed.shape, packed.dtype))
+    ds.attrs["list_type"] = "uarray" if isinstance(item, np.ndarray) else "ufloat_list"
+
+def _read_ufloat_array(item):
+    """
+    Reads a dataset written by _write_ufloat_array into a unumpy array (a list for "ufloat_list").
+    """
+    packed = item[()]
+    uarray = unumpy.uarray(packed["nominal_value"], packed["std_dev"])
+    return list(uarray) if item.attrs["list_type"] == "ufloat_list" else uarray
+
+def _read_attr(entry, name: str):
+    """
+    Reads attribute "name" of entry, looking into the packed scalars written
+    by write_dict_to_hdf5(..., bulk=True) if there is no such attribute.
+    """
+    if name not in entry.attrs and isinstance(entry, h5py.Group) and PACKED_SCALARS_KEY in entry:
+        packed = _read_packed_scalars(entry[PACKED_SCALARS_KEY])
+        if name in packed:
+            return packed[name]
+    return entry.attrs[name]
+
+def write_dict_to_hdf5(data_dict: dict, entry_point, group_overwrite_level: int = np.inf, bulk: bool = False,
+                       profile: str = "raw"):
     """
     Arguments:
         data_dict (dict): dictionary to write to hdf5 file
         entry_point (hdf5 group.file) : location in the nested hdf5 structure where to write to.
         group_overwrite_level(int) ： wheter to overwrite excited level, e.g 0 for overwhrting hdf5 group
+        bulk (bool) : if True, the scalars of each group are packed in a single compound dataset
+            and lists of dicts with the same scalar fields are stored as table datasets, which
+            saves most of the per-item hdf5 metadata operations for large snapshots.
+            read_dict_from_hdf5 reads both layouts.
+        profile (str) : storage profile of the numpy array datasets, see STORAGE_PROFILES
     """
+    if bulk:
+        data_dict = _write_packed_scalars(data_dict, entry_point)
+
     for key, item in data_dict.items():
         if isinstance(item, (str, float, int, bool, np.number, np.float_, np.int_, np.bool_)):
             try:
@@ -48,8 +295,10 @@ def write_dict_to_hdf5(data_dict: dict, entry_point, group_overwrite_level: int
                     " {}:{} of type {} at entry point {}".format(key, item, type(item), entry_point))
                 log.warning(e)
         
+        elif _is_ufloat_array(item):
+            _write_ufloat_array(key, item, entry_point, profile=profile)
         elif isinstance(item, np.ndarray):
-            entry_point.create_dataset(key, data=item)
+            entry_point.create_dataset(key, data=item, **storage_options(profile, item.shape, item.dtype))
         elif item is None:
             # as h5py does not support saving None as attribute
             # I create special string, note that this can create
@@ -72,6 +321,8 @@ def write_dict_to_hdf5(data_dict: dict, entry_point, group_overwrite_level: int
                 data_dict=item,
                 entry_point=entry_point[str_key],
                 group_overwrite_level=group_overwrite_level - 1,
+                bulk=bulk,
+                profile=profile,
             )
 
         elif isinstance(item, UFloat):
@@ -85,7 +336,10 @@ def write_dict_to_hdf5(data_dict: dict, entry_point, group_overwrite_level: int
                 entry_point.create_group(str_key)
 
             new_item = {"nominal_value": item.nominal_value, "std_dev": item.std_dev}
-            write_dict_to_hdf5(data_dict=new_item, entry_point=entry_point[str_key], group_overwrite_level=group_overwrite_level - 1,)
+            write_dict_to_hdf5(data_dict=new_item, entry_point=entry_point[str_key], group_overwrite_level=group_overwrite_level - 1, bulk=bulk, profile=profile)
+
+        elif bulk and _is_dict_table(item):
+            _write_dict_table(key, item, entry_point)
 
         elif isinstance(item, (list, tuple)):
             if len(item) > 0:
@@ -104,12 +358,10 @@ def write_dict_to_hdf5(data_dict: dict, entry_point, group_overwrite_level: int
 
                     # strings are saved as a special dtype hdf5 dataset
                     elif isinstance(item[0], str):
-                        dt = h5py.special_dtype(vlen=str)
-                        data = np.array(item)
-                        data = data.reshape((-1, 1))
-                        ds = entry_point.create_dataset(key, (len(data), 1), dtype=dt)
+                        # 1-D variable length utf-8 dataset, written in one call
+                        data = np.array(item, dtype=object)
+                        ds = entry_point.create_dataset(key, data=data, dtype=h5py.string_dtype("utf-8"))
                         ds.attrs["list_type"] = "str"
-                        ds[:] = data
                     else:
                         # For nested list we don't throw warning, it will be
                         # recovered in case of a snapshot
@@ -149,6 +401,8 @@ def write_dict_to_hdf5(data_dict: dict, entry_point, group_overwrite_level: int
                         data_dict=list_dct,
                         entry_point=entry_point[key],
                         group_overwrite_level=group_overwrite_level - 1,
+                        bulk=bulk,
+                        profile=profile,
                     )
             else:
                 # as h5py does not support saving None as attribute
@@ -162,7 +416,7 @@ def write_dict_to_hdf5(data_dict: dict, entry_point, group_overwrite_level: int
             )
             entry_point.attrs[key] = str(item)
 
-def read_dict_from_hdf5(data_dict: dict, entry_point):
+def read_dict_from_hdf5(data_dict: dict, entry_point, lazy: bool = False):
     """
     Reads a dictionary from an hdf5 file or group that was written using the
     corresponding "write_dict_to_hdf5" function defined above.
@@ -174,7 +428,14 @@ def read_dict_from_hdf5(data_dict: dict, entry_point):
                 function to add the data to an existing data_dict.
         entry_point  (hdf5 group):
                 hdf5 file or group from which to read.
+        lazy (bool):
+                if True, nothing is read up front and a LazyHDF5Dict proxy of entry_point
+                is returned instead (data_dict is not used). The file has to stay open
+                while the proxy is used.
     """
+    if lazy:
+        return LazyHDF5Dict(entry_point)
+
     # if 'list_type' not in entry_point.attrs:
     for key, item in entry_point.items():
         if RepresentsInt(key):
@@ -188,10 +449,13 @@ def read_dict_from_hdf5(data_dict: dict, entry_point):
             elif item.attrs["list_type"] == "str":
                 # lists of strings needs some special care, see also
                 # the writing part in the writing function above.
-                list_of_str = [
-                    x[0] for x in item[()]
-                ]  # changed deprecated item.value => item[()]
-                data_dict[key] = list_of_str
+                data_dict[key] = _read_str_list(item)
+            elif item.attrs["list_type"] == "packed_scalars":
+                data_dict.update(_read_packed_scalars(item))
+            elif item.attrs["list_type"] == "dict_table":
+                data_dict[key] = _read_dict_table(item)
+            elif item.attrs["list_type"] in ("uarray", "ufloat_list"):
+                data_dict[key] = _read_ufloat_array(item)
             elif item.attrs["list_type"] == "array":
                 data_dict[key] = list(
                     item[()]
@@ -248,12 +512,18 @@ def extract_pars_from_datafile(param_spec: dict, filepath: str = None, entry_poi
                     "attr:attribute_name", "dset", "attr:all_attr", or "group"
                     "group" allows to recursively extract all the tree in
                     the group
+                    "dset" accepts a numpy-like selection, read as an hdf5
+                    hyperslab, and a reduction computed chunk by chunk:
+                    "dset[1000:2000, ::4]", "dset['nominal_value', :10]",
+                    "dset[:, 3].mean()", "dset[::2].std(0)"
+                    (reductions: mean, sum, min, max, var, std)
 
             example param_spec
                 param_spec = {
                     'T1': ('Analysis/Fitted Params F|1>/tau', 'attr:value'),
                     'uT1': ('Analysis/Fitted Params F|1>/tau', 'attr:stderr'),
                     'data': ('Experimental Data/Data', 'dset'),
+                    'I_mean': ('data/I', 'dset[:, ::4].mean(0)'),
                     'timestamp': ('MC settings/begintime', 'dset'),
                     'qois': ('Analysis/quantities_of_interest', 'group')}
 
@@ -262,67 +532,395 @@ def extract_pars_from_datafile(param_spec: dict, filepath: str = None, entry_poi
             dictionary containing the extracted parameters.
     """
     if filepath is not None:
-        param_dict = {}
-        f = h5py.File(filepath, "r")
         with h5py.File(filepath, "r") as f:
-            for par_name, par_spec in param_spec.items():
-                try:
-                    entry = f[par_spec[0]]
-                    
-                    if par_spec[1].startswith("dset"):
-                        param_dict[par_name] = entry[()]  # deprecated syntax: entry.value
-                    elif par_spec[1].startswith("attr:all_attr"):
-                        param_dict[par_name] = dict()
-                        for attribute_name in entry.attrs.keys():
-                            param_dict[par_name][attribute_name] = entry.attrs[attribute_name]
-                    elif par_spec[1].startswith("attr"):
-                        param_dict[par_name] = entry.attrs[par_spec[1][5:]]
-                    elif par_spec[1].startswith("group"):
-                        # This should allow to retrieve the entire tree under a certain
-                        # as a dictionary
-                        new_dict = dict()
-                        param_dict[par_name] = read_dict_from_hdf5(new_dict, entry_point=entry)
-                    else:
-                        raise ValueError(
-                            "Parameter spec `{}` not recognized".format(par_spec[1])
-                        )
-                except Exception as err:
-                    raise err
-
-    elif (filepath is None) and (entry_point is not None):
-        for par_name, par_spec in param_spec.items():
-                try:
-                    f = entry_point
-                    entry = f[par_spec[0]]
-                    
-                    if par_spec[1].startswith("dset"):
-                        param_dict[par_name] = entry[()]  # deprecated syntax: entry.value
-                    elif par_spec[1].startswith("attr:all_attr"):
-                        param_dict[par_name] = dict()
-                        for attribute_name in entry.attrs.keys():
-                            param_dict[par_name][attribute_name] = entry.attrs[attribute_name]
-                    elif par_spec[1].startswith("attr"):
-                        param_dict[par_name] = entry.attrs[par_spec[1][5:]]
-                    elif par_spec[1].startswith("group"):
-                        # This should allow to retrieve the entire tree under a certain
-                        # as a dictionary
-                        new_dict = dict()
-                        param_dict[par_name] = read_dict_from_hdf5(new_dict, entry_point=entry)
-                    else:
-                        raise ValueError(
-                            "Parameter spec `{}` not recognized".format(par_spec[1])
-                        )
-                except Exception as err:
-                    raise err
-        
+            return _extract_pars(param_spec, f)
+    return _extract_pars(param_spec, entry_point)
+
+_DSET_SPEC = re.compile(r"^dset(?:\[(?P<index>.*)\])?"
+                        r"(?:\.(?P<reduction>mean|sum|min|max|var|std)\((?:axis=)?(?P<axis>-?\d*)\))?$")
+# Quoted field names, matched first so that their spaces and commas are kept
+_QUOTED_OR_SPACE = re.compile(r"""('[^']*'|"[^"]*")|\s+""")
+_INDEX_TOKEN = re.compile(r"""'[^']*'|"[^"]*"|[^,]+""")
+# Size in bytes of the blocks read by chunk-wise reductions
+REDUCTION_CHUNK_BYTES = 16 * 1024 * 1024
+
+def _parse_index(index: str, ndim: int) -> tuple:
+    """
+    Parses a numpy-like index "1000:2000, ::4", "'field', 3" or "..., 0" into
+    a tuple of field names, slices and ints covering every axis of the dataset.
+    """
+    fields, axes = [], []
+    for token in (t.strip() for t in _INDEX_TOKEN.findall(index)):
+        if not token:
+            continue
+        if token[0] in "'\"" and token[-1] == token[0]:
+            fields.append(token[1:-1])
+        elif token == "...":
+            axes.append(Ellipsis)
+        elif ":" in token:
+            bounds = [int(x) if x.strip() else None for x in token.split(":")]
+            axes.append(slice(*bounds))
+        else:
+            axes.append(int(token))
+    if Ellipsis in axes:
+        i = axes.index(Ellipsis)
+        axes[i:i + 1] = [slice(None)] * (ndim - len(axes) + 1)
+    axes += [slice(None)] * (ndim - len(axes))
+    return tuple(fields), tuple(axes)
+
+class _Reduction(object):
+    """
+    Running reduction over blocks along the first axis, with the parallel
+    (Chan et al.) update for the variance.
+    """
+    def __init__(self, name: str):
+        self.name = name
+        self.count = 0
+        self.value = None
+        self.mean = None
+        self.m2 = None
+
+    def add(self, block, axis):
+        n = block.shape[0] if axis == 0 else block.size
+        if n == 0:
+            return
+        if self.name in ("mean", "var", "std"):
+            block_mean = block.mean(axis=axis)
+            block_m2 = ((block - (block_mean if axis is None else block_mean[np.newaxis])) ** 2).sum(axis=axis)
+            if self.count == 0:
+                self.mean, self.m2 = block_mean, block_m2
+            else:
+                delta = block_mean - self.mean
+                total = self.count + n
+                self.mean = self.mean + delta * n / total
+                self.m2 = self.m2 + block_m2 + delta ** 2 * self.count * n / total
+        else:
+            block_value = getattr(np, self.name)(block, axis=axis)
+            if self.value is None:
+                self.value = block_value
+            elif self.name == "sum":
+                self.value = self.value + block_value
+            else:
+                self.value = (np.minimum if self.name == "min" else np.maximum)(self.value, block_value)
+        self.count += n
+
+    def result(self):
+        if self.name == "mean":
+            return self.mean
+        if self.name in ("var", "std"):
+            var = self.m2 / self.count
+            return np.sqrt(var) if self.name == "std" else var
+        return self.value
+
+def _read_dset_spec(dset, spec: str, chunk_bytes: int = REDUCTION_CHUNK_BYTES):
+    """
+    Reads the selection and reduction of a "dset[...].reduction(axis)" spec,
+    see extract_pars_from_datafile. Only the selected hyperslab is read, in
+    blocks along the first axis when a reduction is requested.
+    """
+    match = _DSET_SPEC.match(_QUOTED_OR_SPACE.sub(lambda m: m.group(1) or "", spec))
+    if match is None:
+        raise ValueError("Parameter spec `{}` not recognized".format(spec))
+    index, reduction, axis = match.group("index"), match.group("reduction"), match.group("axis")
+    if index is None and reduction is None:
+        return dset[()]  # deprecated syntax: entry.value
+
+    fields, axes = _parse_index(index or "", dset.ndim)
+    if any(isinstance(sl, slice) and sl.step is not None and sl.step < 1 for sl in axes):
+        raise ValueError("Negative or zero steps are not supported by hdf5: `{}`".format(spec))
+    if reduction is None:
+        return dset[fields + axes]
+
+    axis = int(axis) if axis else None
+    first = axes[0] if axes else None
+    if not isinstance(first, slice):
+        # no first axis to split the reading along
+        return getattr(np, reduction)(dset[fields + axes], axis=axis)
+
+    result_ndim = sum(isinstance(sl, slice) for sl in axes)
+    if axis is not None and axis < 0:
+        axis += result_ndim
+    start, stop, step = first.indices(dset.shape[0])
+    row_bytes = dset.dtype.itemsize * int(np.prod(dset.shape[1:]))
+    block_rows = max(1, chunk_bytes // max(row_bytes, 1)) * step
+
+    accumulator, blocks = _Reduction(reduction), []
+    for block_start in range(start, stop, block_rows):
+        block_sl = slice(block_start, min(block_start + block_rows, stop), step)
+        block = dset[fields + (block_sl,) + axes[1:]]
+        if axis in (None, 0):
+            accumulator.add(block, axis)
+        else:
+            blocks.append(getattr(np, reduction)(block, axis=axis))
+    if axis in (None, 0):
+        return accumulator.result()
+    return np.concatenate(blocks, axis=0)
+
+def _extract_pars(param_spec: dict, entry_point) -> dict:
+    param_dict = {}
+    for par_name, par_spec in param_spec.items():
+        entry = entry_point[par_spec[0]]
+
+        if par_spec[1].startswith("dset"):
+            param_dict[par_name] = _read_dset_spec(entry, par_spec[1])
+        elif par_spec[1].startswith("attr:all_attr"):
+            param_dict[par_name] = dict()
+            for attribute_name in entry.attrs.keys():
+                param_dict[par_name][attribute_name] = entry.attrs[attribute_name]
+            if isinstance(entry, h5py.Group) and PACKED_SCALARS_KEY in entry:
+                param_dict[par_name].update(_read_packed_scalars(entry[PACKED_SCALARS_KEY]))
+        elif par_spec[1].startswith("attr"):
+            param_dict[par_name] = _read_attr(entry, par_spec[1][5:])
+        elif par_spec[1].startswith("group"):
+            # This should allow to retrieve the entire tree under a certain
+            # as a dictionary
+            new_dict = dict()
+            param_dict[par_name] = read_dict_from_hdf5(new_dict, entry_point=entry)
+        else:
+            raise ValueError(
+                "Parameter spec `{}` not recognized".format(par_spec[1])
+            )
     return param_dict
+
+def _extract_pars_from_file(args):
+    """
+    Worker of extract_pars_from_datafiles, returns (filepath, param_dict or None, error message).
+    """
+    param_spec, filepath = args
+    try:
+        return filepath, extract_pars_from_datafile(param_spec, filepath=filepath), None
+    except Exception as err:
+        return filepath, None, "{}: {}".format(type(err).__name__, err)
+
+def _to_column(values: list) -> np.ndarray:
+    """
+    Stacks the values extracted from several files in a numpy array, falling back
+    to an object array if they do not share a shape and a numeric/string type.
+    """
+    try:
+        column = np.array(values)
+    except ValueError:
+        column = None
+    if column is None or column.dtype.hasobject or len(column) != len(values):
+        column = np.empty(len(values), dtype=object)
+        for i, value in enumerate(values):
+            column[i] = value
+    return column
+
+class _ExtractionIndex(object):
+    """
+    Sqlite sidecar cache of parameters extracted by extract_pars_from_datafiles,
+    keyed on file path, modification time and parameter specification.
+    """
+    def __init__(self, index_path: str, param_spec: dict):
+        self._connection = sqlite3.connect(index_path)
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS extracted "
+            "(path TEXT, spec TEXT, mtime REAL, params BLOB, PRIMARY KEY (path, spec))")
+        self._spec = repr(sorted((str(k), tuple(v)) for k, v in param_spec.items()))
+
+    def get(self, filepath: str, mtime: float):
+        row = self._connection.execute(
+            "SELECT params FROM extracted WHERE path = ? AND spec = ? AND mtime = ?",
+            (filepath, self._spec, mtime)).fetchone()
+        return None if row is None else pickle.loads(row[0])
+
+    def put(self, filepath: str, mtime: float, param_dict: dict):
+        self._connection.execute(
+            "INSERT OR REPLACE INTO extracted VALUES (?, ?, ?, ?)",
+            (filepath, self._spec, mtime, pickle.dumps(param_dict)))
+
+    def close(self):
+        self._connection.commit()
+        self._connection.close()
+
+def extract_pars_from_datafiles(param_spec: dict, filepaths, index_path: str = None,
+                                processes: int = None, skip_errors: bool = False) -> dict:
+    """
+    Extract the parameters "param_spec" from many hdf5 datafiles in parallel.
+
+    Arguments:
+        param_spec (dict) : see extract_pars_from_datafile
+        filepaths (str or list) : list of datafiles or a glob pattern
+            (recursive "**" allowed) matching them
+        index_path (str) : path of an sqlite sidecar index. Files already in the
+            index with an unchanged modification time are not opened again.
+        processes (int) : size of the process pool, defaults to the number of
+            cpus. 1 extracts in the calling process. As for any process pool,
+            scripts calling this on Windows need an "if __name__ == '__main__'" guard.
+        skip_errors (bool) : if True, files missing a parameter are logged and
+            left out instead of raising
+
+    Return:
+        param_dict (dict)
+            "filepath" and every key of param_spec mapped to a numpy array with one
+            entry per file, in the order of filepaths (sorted if a pattern is given).
+    """
+    if isinstance(filepaths, str):
+        filepaths = sorted(glob.glob(filepaths, recursive=True))
+    filepaths = [os.path.abspath(filepath) for filepath in filepaths]
+
+    index = _ExtractionIndex(index_path, param_spec) if index_path is not None else None
+    extracted, to_extract, mtimes = {}, [], {}
+    for filepath in filepaths:
+        mtimes[filepath] = os.path.getmtime(filepath)
+        cached = index.get(filepath, mtimes[filepath]) if index is not None else None
+        if cached is not None:
+            extracted[filepath] = cached
+        else:
+            to_extract.append(filepath)
+
+    jobs = [(param_spec, filepath) for filepath in to_extract]
+    if processes == 1 or len(jobs) <= 1:
+        outputs = map(_extract_pars_from_file, jobs)
+    else:
+        with ProcessPoolExecutor(max_workers=processes) as pool:
+            outputs = list(pool.map(_extract_pars_from_file, jobs, chunksize=16))
+
+    try:
+        for filepath, param_dict, error in outputs:
+            if error is not None:
+                if not skip_errors:
+                    raise ValueError("Could not extract parameters from {}: {}".format(filepath, error))
+                log.warning("Skipping {}: {}".format(filepath, error))
+                continue
+            extracted[filepath] = param_dict
+            if index is not None:
+                index.put(filepath, mtimes[filepath], param_dict)
+    finally:
+        if index is not None:
+            index.close()
+
+    filepaths = [filepath for filepath in filepaths if filepath in extracted]
+    param_dict = {"filepath": np.array(filepaths, dtype=str)}
+    for par_name in param_spec:
+        param_dict[par_name] = _to_column([extracted[filepath][par_name] for filepath in filepaths])
+    return param_dict
+
 ########################################
 #           class 
 ########################################
+class LazyHDF5Dict(Mapping):
+    """
+    Read-only dict-like view of an hdf5 file or group written by "write_dict_to_hdf5".
+
+    Items are only read when they are accessed: subgroups become LazyHDF5Dict,
+    plain datasets are returned as np.memmap views when they are stored contiguous
+    and uncompressed (h5py datasets otherwise) and are read once sliced, and lists
+    are converted on access. Opening a large file and browsing its metadata is
+    therefore independent of the size of the stored data.
+    """
+    def __init__(self, entry_point, memmap: bool = True):
+        """
+        Arguments:
+            entry_point (hdf5 group) : hdf5 file or group from which to read
+            memmap (bool) : whether to map contiguous datasets with np.memmap
+        """
+        self._entry_point = entry_point
+        self._memmap = memmap
+        self._cache = {}
+        self._packed = None
+
+        # Only the names are read here, in the order read_dict_from_hdf5 uses
+        self._names = {}
+        for name in entry_point.keys():
+            if name == PACKED_SCALARS_KEY:
+                for field in entry_point[name].dtype.names:
+                    self._names[field] = None
+            else:
+                self._names[int(name) if RepresentsInt(name) else name] = name
+        for name in entry_point.attrs.keys():
+            self._names[name] = None
+
+    def __repr__(self):
+        return "LazyHDF5Dict({}, keys={})".format(self._entry_point.name, list(self._names))
+
+    def __iter__(self):
+        return iter(self._names)
+
+    def __len__(self):
+        return len(self._names)
+
+    def __contains__(self, key):
+        return key in self._names
+
+    def __getitem__(self, key):
+        if key not in self._cache:
+            self._cache[key] = self._read(key)
+        return self._cache[key]
+
+    def _read(self, key):
+        if key not in self._names:
+            raise KeyError(key)
+
+        name = self._names[key]
+        if name is None:  # attribute or packed scalar
+            if key in self._entry_point.attrs:
+                item = self._entry_point.attrs[key]
+                if isinstance(item, str):
+                    if item == "NoneType:__None__":
+                        item = None
+                    elif item == "NoneType:__emptylist__":
+                        item = []
+                return item
+            if self._packed is None:
+                self._packed = _read_packed_scalars(self._entry_point[PACKED_SCALARS_KEY])
+            return self._packed[key]
+
+        item = self._entry_point[name]
+        if isinstance(item, h5py.Group):
+            list_type = item.attrs.get("list_type", None)
+            if list_type in ("generic_list", "generic_tuple"):
+                sub_dict = LazyHDF5Dict(item, memmap=self._memmap)
+                data_list = [sub_dict["list_idx_{}".format(i)]
+                             for i in range(item.attrs["list_length"])]
+                return tuple(data_list) if list_type == "generic_tuple" else data_list
+            return LazyHDF5Dict(item, memmap=self._memmap)
+
+        if "list_type" not in item.attrs:
+            return self._dataset_view(item)
+        elif item.attrs["list_type"] == "str":
+            return _read_str_list(item)
+        elif item.attrs["list_type"] == "dict_table":
+            return _read_dict_table(item)
+        elif item.attrs["list_type"] in ("uarray", "ufloat_list"):
+            return _read_ufloat_array(item)
+        return list(item[()])
+
+    def _dataset_view(self, item):
+        """
+        Returns an np.memmap of the dataset if it is stored contiguous, uncompressed
+        and with a plain numeric dtype in the file, else the h5py dataset itself.
+        """
+        if not self._memmap or item.chunks is not None or item.shape == () \
+                or item.dtype.hasobject or item.dtype.names is not None:
+            return item
+        offset = item.id.get_offset()
+        if offset is None:  # no data written yet
+            return item
+        return np.memmap(item.file.filename, mode="r", dtype=item.dtype,
+                         shape=item.shape, offset=offset)
+
+    def to_dict(self) -> dict:
+        """
+        Reads everything below this group, same as read_dict_from_hdf5.
+        """
+        return read_dict_from_hdf5({}, self._entry_point)
+
 class DateTimeGenerator(object):
     """
     Class to generate filenames / directories based on the date and time.
+
+    Time-stamped names ("%H%M%S_name") are reserved atomically by creating the
+    directory or an empty file (O_EXCL), so several processes can write into the
+    same data directory. If a name is taken, a counter is added to the time
+    stamp ("%H%M%S-1_name", "%H%M%S-2_name", ...). Names already handed out are
+    remembered per directory, so repeated allocations do not touch the disk
+    more than once per name.
     """
+    # names reserved by this process, per directory
+    _used_names = {}
+    _used_names_lock = threading.Lock()
 
     def __init__(self, timesubdir: bool = False, timefilename: bool = False):
         """
@@ -333,6 +931,37 @@ class DateTimeGenerator(object):
         self.timesubdir = timesubdir
         self.timefilename = timefilename
 
+    def _reserve(self, directory: str, tsd: str, name: str = None, extension: str = "",
+                 is_dir: bool = False) -> str:
+        """
+        Atomically creates and returns the first free path "directory/tsd[-counter][_name]extension".
+        Files are created empty, directories are created with os.mkdir.
+        """
+        os.makedirs(directory, exist_ok=True)
+        with self._used_names_lock:
+            used = self._used_names.setdefault(os.path.abspath(directory), set())
+
+        counter = 0
+        while True:
+            stem = tsd if counter == 0 else "{}-{}".format(tsd, counter)
+            candidate = stem + ("_" + name if name is not None else "") + extension
+            counter += 1
+            with self._used_names_lock:
+                if candidate in used:
+                    continue
+                used.add(candidate)
+
+            path = os.path.join(directory, candidate)
+            try:
+                if is_dir:
+                    os.mkdir(path)
+                else:
+                    os.close(os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+            except FileExistsError:
+                # taken by another process or by an earlier run
+                continue
+            return path
+
     def create_data_dir(self, datadir: str, name: str = None, ts=None, datesubdir: bool = True, timesubdir: bool = False):
         """
         Create and return a new data directory.
@@ -357,34 +986,7 @@ class DateTimeGenerator(object):
         
         if timesubdir or self.timesubdir:
             tsd = time.strftime("%H%M%S", ts)
-            timestamp_verified = False
-            counter = 0
-            
-            # Verify if timestamp is unique by seeing if the folder exists
-            while not timestamp_verified:
-                counter += 1
-                try:
-                    measdirs = [d for d in os.listdir(path) if d[:6] == tsd]
-                    if len(measdirs) == 0:
-                        timestamp_verified = True
-                    else:
-                        # if timestamp not unique, add one second
-                        # This is quite a hack
-                        ts = time.localtime((time.mktime(ts) + 1))
-                        tsd = time.strftime("%H%M%S", ts)
-                    if counter >= 3600:
-                        raise Exception()
-                except OSError as err:
-                    if "cannot find the path specified" in str(err):
-                        timestamp_verified = True
-                    elif "No such file or directory" in str(err):
-                        timestamp_verified = True
-                    else:
-                        raise err
-            if name is not None:
-                path = os.path.join(path, tsd + "_" + name)
-            else:
-                path = os.path.join(path, tsd)  
+            path = self._reserve(path, tsd, name=name, is_dir=True)
 
         return path
 
@@ -409,32 +1011,8 @@ class DateTimeGenerator(object):
                 ts = time.localtime()
             
             tsd = time.strftime("%H%M%S", ts)
-            timestamp_verified = False
-            counter = 0
-
-            # Verify if timestamp is unique by seeing if the folder exists
-            while not timestamp_verified:
-                counter += 1
-                try:
-                    measdirs = [d for d in os.listdir(path) if d[:6] == tsd]
-                    if len(measdirs) == 0:
-                        timestamp_verified = True
-                    else:
-                        # if timestamp not unique, add one second
-                        # This is quite a hack
-                        ts = time.localtime((time.mktime(ts) + 1))
-                        tsd = time.strftime("%H%M%S", ts)
-                    if counter >= 3600:
-                        raise Exception()
-                except OSError as err:
-                    if "cannot find the path specified" in str(err):
-                        timestamp_verified = True
-                    elif "No such file or directory" in str(err):
-                        timestamp_verified = True
-                    else:
-                        raise err
-
-            filename = "%s_%s.hdf5" % (tsd, data_obj._name)
+            # reserves the file as an empty placeholder
+            return self._reserve(path, tsd, name=data_obj._name, extension=".hdf5")
         else: 
             filename = "%s.hdf5" % (data_obj._name)
         
@@ -443,30 +1021,317 @@ class DateTimeGenerator(object):
 class DatasetFile(h5py.File):
     """ 
     Create the hdf5 file in the date directory (or time subdirectory) in the base path of "datadir" 
+
+    Besides whole-array writes through "write_dict_to_hdf5", results can be
+    streamed into the file batch by batch: declare a stream with
+    "create_stream" and grow it with "append". Streams are chunked datasets
+    that are resizable along the first (shot) axis, so only the current batch
+    has to be kept in memory and everything appended before a crash stays
+    readable.
+
+    With background=True, "append" only copies the batch into a bounded queue
+    that a dedicated writer thread drains, so the caller never waits on the
+    disk unless the queue is full. Errors of the writer thread are raised by
+    the next "append", "flush" or "close" call.
+
+    With swmr=True the file is created for HDF5 single-writer/multiple-reader
+    access. Once all streams are declared, "start_swmr" switches the file to
+    SWMR mode: no new datasets can be created anymore, but other processes can
+    follow the growing streams with a StreamTail while the measurement runs.
     """
-    def __init__(self, name: str, datadir: str, timesubdir: bool = False, timefilename: bool = False):
+    def __init__(self, name: str, datadir: str, timesubdir: bool = False, timefilename: bool = False,
+                 chunk_size: int = DEFAULT_CHUNK_SIZE, flush_interval: float = DEFAULT_FLUSH_INTERVAL,
+                 profile: str = "raw", background: bool = False, queue_size: int = DEFAULT_QUEUE_SIZE,
+                 swmr: bool = False, catalog = None, filepath: str = None):
         """
         Creates an empty data set including the file, for which the currently
-        set file name generator is used.
+        set file name generator is used, or reopens an existing one.
 
         Arguments:
             name (str) : base name of the file
             datadir (str) : A base path where the hdf5file will be created in its subdirectory 
                 using the standard timestamp structure
+            chunk_size (int) : maximum number of shots per chunk of a "raw" stream
+            flush_interval (float) : minimum time in seconds between two flushes
+                triggered by "append", 0 flushes after every append
+            profile (str) : storage profile of streams and of arrays written with
+                "write_dict", one of STORAGE_PROFILES
+            background (bool) : whether appends are written by a writer thread
+            queue_size (int) : maximum number of batches waiting for the writer
+                thread, "append" blocks while the queue is full
+            swmr (bool) : whether to create the file with the latest hdf5 file format,
+                as needed for "start_swmr"
+            catalog (RunCatalog) : run catalog in which the file is registered
+                when it is created and updated when it is closed
+            filepath (str) : path of an existing run file to reopen in append mode,
+                e.g. to resume a measurement after a crash, instead of a new file
         """
+        if profile not in STORAGE_PROFILES:
+            raise ValueError("Storage profile `{}` not in {}".format(profile, STORAGE_PROFILES))
+        self.profile = profile
+        self._datadir = datadir
         self._timesubdir = timesubdir
         self._timefilename = timefilename
         self._name = name
+        self._chunk_size = chunk_size
+        self._flush_interval = flush_interval
+        self._last_flush = time.time()
+        self._writer = None
+        self._writer_error = None
+        self._swmr = swmr
+        self._catalog = catalog
         
         self._localtime = time.localtime()
         self._timestamp = time.asctime(self._localtime)
         self._timemark = time.strftime("%H%M%S", self._localtime)
         self._datemark = time.strftime("%Y%m%d", self._localtime)
 
-        self.filepath = DateTimeGenerator(timesubdir=self._timesubdir, timefilename=self._timefilename).new_filename(self, path=datadir)
+        reopened = filepath is not None
+        if reopened:
+            if not os.path.isfile(filepath):
+                raise FileNotFoundError("No run file `{}` to reopen".format(filepath))
+            self.filepath = os.path.abspath(filepath)
+        else:
+            self.filepath = DateTimeGenerator(timesubdir=self._timesubdir, timefilename=self._timefilename).new_filename(self, path=datadir)
         self.folder, self._filename = os.path.split(self.filepath)
         
         if not os.path.isdir(self.folder):
             os.makedirs(self.folder)
-        super(DatasetFile, self).__init__(self.filepath, "a")
+        # a reserved, still empty file is not a valid hdf5 file and is truncated
+        mode = "w" if os.path.isfile(self.filepath) and os.path.getsize(self.filepath) == 0 else "a"
+        if swmr:
+            super(DatasetFile, self).__init__(self.filepath, mode, libver="latest")
+        else:
+            super(DatasetFile, self).__init__(self.filepath, mode)
+        self.flush()
+        if self._catalog is not None and not reopened:
+            self._catalog.register(self.filepath, name=self._name, timestamp=self._localtime)
+
+        if background:
+            self._queue = queue.Queue(maxsize=queue_size)
+            self._writer = threading.Thread(target=self._write_loop, daemon=True,
+                                            name="DatasetFile writer ({})".format(self._filename))
+            self._writer.start()
+
+    def start_swmr(self):
+        """
+        Switches the file to single-writer/multiple-reader mode. All streams must
+        have been declared with "create_stream" before.
+        """
+        if not self._swmr:
+            raise ValueError("SWMR needs a DatasetFile created with swmr=True")
         self.flush()
+        self.swmr_mode = True
+
+    def _write_loop(self):
+        """
+        Writes the batches queued by "append" until "close" queues None.
+        """
+        dirty = False
+        while True:
+            try:
+                task = self._queue.get(timeout=self._flush_interval or None)
+            except queue.Empty:
+                # idle, makes sure everything appended so far is on disk
+                if dirty and self._writer_error is None:
+                    self._flush_file()
+                    dirty = False
+                continue
+            try:
+                if task is None:
+                    return
+                if self._writer_error is None:
+                    self._append(*task)
+                    dirty = True
+            except Exception as err:
+                self._writer_error = err
+            finally:
+                self._queue.task_done()
+
+    def _raise_writer_error(self):
+        if self._writer_error is not None:
+            raise RuntimeError("DatasetFile writer thread failed, later batches "
+                               "were not written") from self._writer_error
+
+    def _flush_file(self):
+        super(DatasetFile, self).flush()
+        self._last_flush = time.time()
+
+    def flush(self):
+        """
+        Waits until all queued batches are written and flushes the file to disk.
+        """
+        if self._writer is not None:
+            self._queue.join()
+            self._raise_writer_error()
+        self._flush_file()
+
+    def close(self):
+        """
+        Writes all queued batches, stops the writer thread and closes the file.
+        """
+        if self._writer is not None:
+            self._queue.put(None)
+            self._writer.join()
+            self._writer = None
+        super(DatasetFile, self).close()
+        if self._catalog is not None:
+            self._catalog.update(self.filepath)
+        self._raise_writer_error()
+
+    def write_dict(self, data_dict: dict, group_overwrite_level: int = np.inf, bulk: bool = False):
+        """
+        Writes data_dict at the root of the file with "write_dict_to_hdf5", using the file's storage profile.
+        """
+        write_dict_to_hdf5(data_dict, self, group_overwrite_level=group_overwrite_level,
+                           bulk=bulk, profile=self.profile)
+
+    def write_snapshot(self, snapshot: dict, key: str = "snapshot", store = None) -> str:
+        """
+        Writes a snapshot (e.g. the parameters of a Stage) once to a SnapshotStore and
+        links it as "key" in the file, which thereby holds only its hash and a reference.
+
+        Arguments:
+            snapshot (dict) : snapshot to store
+            key (str) : name of the link in the file
+            store (SnapshotStore) : defaults to the store of the file's data directory
+
+        Return:
+            the hash of the snapshot
+        """
+        # imported here, as snapshot_store imports this module
+        from result.snapshot_store import SnapshotStore
+        if store is None:
+            store = SnapshotStore(self._datadir)
+        return store.write(snapshot, self, key=key)
+
+    def create_stream(self, key: str, shape: tuple = (), dtype = float, chunk_size: int = None,
+                      profile: str = None):
+        """
+        Create an empty dataset that grows along its first axis with every "append".
+
+        Arguments:
+            key (str) : "/" separated path of the dataset, missing groups are created
+            shape (tuple) : shape of a single shot, e.g. the sweep buffer shape
+            dtype : numpy dtype of the stored values
+            chunk_size (int) : number of shots per chunk. By default chunks of "raw" streams
+                hold at most the file's chunk size and about RAW_CHUNK_BYTES, and chunks
+                of compressed streams are sized by the profile (see "chunk_shape")
+            profile (str) : storage profile, defaults to the file's profile
+
+        Return:
+            the created h5py dataset
+        """
+        if profile is None:
+            profile = self.profile
+        shape = tuple(shape)
+        options = storage_options(profile, (0,) + shape, dtype, chunk_rows=chunk_size, resizable=True)
+        if "chunks" not in options:
+            # "raw" streams: chunks of at most the file's chunk size and about RAW_CHUNK_BYTES
+            chunks = chunk_shape((0,) + shape, np.dtype(dtype).itemsize, RAW_CHUNK_BYTES, chunk_size)
+            if chunk_size is None:
+                chunks = (min(chunks[0], self._chunk_size),) + chunks[1:]
+            options["chunks"] = chunks
+        dset = self.create_dataset(key, shape=(0,) + shape, maxshape=(None,) + shape,
+                                   dtype=dtype, **options)
+        return dset
+
+    def append(self, key: str, batch):
+        """
+        Append a batch of shots to the stream "key" created by "create_stream".
+
+        Arguments:
+            key (str) : path of the stream, if it does not exist yet it is
+                created with the shot shape and dtype of "batch"
+            batch (array like) : either a single shot with the stream's shot shape
+                or an array of shots stacked along the first axis
+
+        Return:
+            the length of the stream after appending, None in background mode
+        """
+        if self._writer is not None:
+            self._raise_writer_error()
+            # copy, as the caller may reuse the batch while it waits in the queue
+            self._queue.put((key, np.array(batch)))
+            return None
+        return self._append(key, batch)
+
+    def _append(self, key: str, batch):
+        if key not in self:
+            if self.swmr_mode:
+                raise ValueError("Stream `{}` has to be declared before start_swmr".format(key))
+            batch = np.asarray(batch)
+            self.create_stream(key, shape=batch.shape[1:], dtype=batch.dtype)
+        dset = self[key]
+        shot_shape = dset.shape[1:]
+        batch = np.asarray(batch, dtype=dset.dtype)
+        if batch.shape == shot_shape:
+            batch = batch.reshape((1,) + shot_shape)
+        elif batch.shape[1:] != shot_shape:
+            raise ValueError(
+                "Batch of shape {} does not match the shot shape {} of stream `{}`".format(
+                    batch.shape, shot_shape, key))
+
+        prev_len = dset.shape[0]
+        new_len = prev_len + batch.shape[0]
+        if new_len == prev_len:
+            return prev_len
+        dset.resize(new_len, axis=0)
+        dset[prev_len:new_len] = batch
+
+        if time.time() - self._last_flush >= self._flush_interval:
+            self._flush_file()
+        return new_len
+
+class StreamTail(object):
+    """
+    Follows the streams of a DatasetFile that another process writes in SWMR mode.
+
+    Each call of "refresh" returns only the rows appended since the previous
+    call, so live plots and monitors can tail a running measurement without
+    reopening the file or sharing state with the acquisition process.
+    """
+    def __init__(self, filepath: str, keys: list = None):
+        """
+        Arguments:
+            filepath (str) : path of the hdf5 file, "start_swmr" must have been called on it
+            keys (list) : paths of the streams to follow, by default all datasets that
+                are resizable along their first axis
+        """
+        self._file = h5py.File(filepath, "r", libver="latest", swmr=True)
+        if keys is None:
+            keys = []
+            self._file.visititems(
+                lambda name, item: keys.append(name)
+                if isinstance(item, h5py.Dataset) and item.maxshape[:1] == (None,) else None)
+        self._positions = {key: 0 for key in keys}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    @property
+    def positions(self) -> dict:
+        """
+        Number of rows of each stream returned so far.
+        """
+        return dict(self._positions)
+
+    def refresh(self) -> dict:
+        """
+        Return:
+            dict of stream path to an array with the rows appended since the last refresh
+        """
+        new_rows = {}
+        for key, position in self._positions.items():
+            dset = self._file[key]
+            dset.refresh()
+            length = dset.shape[0]
+            new_rows[key] = dset[position:length]
+            self._positions[key] = length
+        return new_rows
+
+    def close(self):
+        self._file.close()
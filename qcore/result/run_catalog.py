@@ -0,0 +1,223 @@
+"""
+Module for the run catalog, an sqlite index of the hdf5 run files in a data directory.
+
+The catalog stores for every run file its name, timestamp, measurement type,
+key parameters (the scalars at the root of the file) and fit results (the
+scalars of its "fit" group), so that calibration lookups do not have to crawl
+the "%Y%m%d/%H%M%S_name" tree created by DateTimeGenerator.
+"""
+import datetime
+import json
+import logging as log
+import os
+import re
+import sqlite3
+import time
+import h5py
+import numpy as np
+
+from result.hdf5_register import PACKED_SCALARS_KEY, _read_packed_scalars
+
+CATALOG_FILENAME = "catalog.sqlite"
+FIT_GROUP = "fit"
+# Directories holding a file of this name (e.g. a snapshot store) hold no runs
+NO_RUNS_MARKER = ".noruns"
+
+# "%H%M%S[-counter]_name.hdf5" files and "%H%M%S[-counter]_name" directories
+_TIME_NAME_PATTERN = re.compile(r"^(\d{6})(?:-\d+)?(?:_(.*))?$")
+
+def _to_json_value(value):
+    if isinstance(value, bytes):
+        return value.decode("utf-8")
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    return value
+
+def _read_scalars(group) -> dict:
+    """
+    Reads the attributes and packed scalars of an hdf5 group.
+    """
+    scalars = {key: _to_json_value(value) for key, value in group.attrs.items()}
+    if PACKED_SCALARS_KEY in group:
+        scalars.update({key: _to_json_value(value) for key, value
+                        in _read_packed_scalars(group[PACKED_SCALARS_KEY]).items()})
+    return scalars
+
+def _to_epoch(t) -> float:
+    if isinstance(t, datetime.datetime):
+        return t.timestamp()
+    if isinstance(t, time.struct_time):
+        return time.mktime(t)
+    return float(t)
+
+class RunCatalog(object):
+    """
+    Sqlite index of the run files below a data directory.
+
+    DatasetFile registers a run when the file is created and updates it when the
+    file is closed (pass catalog=RunCatalog(datadir)). "rescan" indexes files
+    written without a catalog, re-reading only files whose mtime changed.
+    """
+    def __init__(self, datadir: str, path: str = None):
+        """
+        Arguments:
+            datadir (str) : base directory of the run files
+            path (str) : path of the sqlite database, by default "catalog.sqlite" in datadir
+        """
+        self.datadir = os.path.abspath(datadir)
+        os.makedirs(self.datadir, exist_ok=True)
+        self.path = path if path is not None else os.path.join(self.datadir, CATALOG_FILENAME)
+        self._connection = sqlite3.connect(self.path, timeout=30)
+        self._connection.row_factory = sqlite3.Row
+        with self._connection:
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS runs (path TEXT PRIMARY KEY, name TEXT, "
+                "timestamp REAL, measurement TEXT, mtime REAL, params TEXT, fit TEXT)")
+            self._connection.execute(
+                "CREATE INDEX IF NOT EXISTS runs_measurement_timestamp ON runs (measurement, timestamp)")
+            self._connection.execute("CREATE INDEX IF NOT EXISTS runs_timestamp ON runs (timestamp)")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        self._connection.close()
+
+    def _parse_path(self, filepath: str):
+        """
+        Returns the run name and timestamp encoded in the path of a run file,
+        using the file's mtime if the path does not follow the usual structure.
+        """
+        folder, filename = os.path.split(filepath)
+        stem = os.path.splitext(filename)[0]
+        match = _TIME_NAME_PATTERN.match(stem)
+        if match is None:
+            # time subdirectory containing "name.hdf5"
+            folder, timedir = os.path.split(folder)
+            match = _TIME_NAME_PATTERN.match(timedir)
+            name = stem
+        else:
+            name = match.group(2) or stem
+        datedir = os.path.basename(folder)
+        try:
+            ts = time.strptime(datedir + match.group(1), "%Y%m%d%H%M%S")
+            return name, time.mktime(ts)
+        except (AttributeError, ValueError):
+            return name, os.path.getmtime(filepath)
+
+    def register(self, filepath: str, name: str = None, timestamp = None, measurement: str = None):
+        """
+        Adds a run that was just created, before anything is written to it.
+
+        Arguments:
+            filepath (str) : path of the run file
+            name (str) : run name, parsed from the path by default
+            timestamp : run start as epoch seconds, datetime or time.struct_time
+            measurement (str) : measurement type, defaults to the run name
+        """
+        filepath = os.path.abspath(filepath)
+        parsed_name, parsed_timestamp = self._parse_path(filepath)
+        name = name if name is not None else parsed_name
+        timestamp = _to_epoch(timestamp) if timestamp is not None else parsed_timestamp
+        with self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO runs VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (filepath, name, timestamp, measurement or name, None, "{}", "{}"))
+
+    def update(self, filepath: str):
+        """
+        (Re-)reads the measurement type, key parameters and fit results of a run file.
+        The measurement type is the root attribute "measurement" if present.
+        """
+        filepath = os.path.abspath(filepath)
+        mtime = os.path.getmtime(filepath)
+        with h5py.File(filepath, "r") as f:
+            params = _read_scalars(f)
+            fit = _read_scalars(f[FIT_GROUP]) if isinstance(f.get(FIT_GROUP), h5py.Group) else {}
+
+        row = self._connection.execute(
+            "SELECT name, timestamp, measurement FROM runs WHERE path = ?", (filepath,)).fetchone()
+        if row is None:
+            name, timestamp = self._parse_path(filepath)
+            measurement = name
+        else:
+            name, timestamp, measurement = row["name"], row["timestamp"], row["measurement"]
+        measurement = params.get("measurement", measurement)
+        with self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO runs VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (filepath, name, timestamp, str(measurement), mtime,
+                 json.dumps(params, default=str), json.dumps(fit, default=str)))
+
+    def rescan(self) -> int:
+        """
+        Indexes new and modified run files below datadir and forgets deleted ones.
+        Directories holding a NO_RUNS_MARKER file are not searched.
+
+        Return:
+            number of files that were (re-)read
+        """
+        known = {row["path"]: row["mtime"] for row in
+                 self._connection.execute("SELECT path, mtime FROM runs")}
+        found, n_updated = set(), 0
+        stack = [self.datadir]
+        while stack:
+            with os.scandir(stack.pop()) as entries:
+                for entry in entries:
+                    if entry.is_dir():
+                        if not os.path.exists(os.path.join(entry.path, NO_RUNS_MARKER)):
+                            stack.append(entry.path)
+                    elif entry.name.endswith(".hdf5"):
+                        filepath = os.path.abspath(entry.path)
+                        found.add(filepath)
+                        if known.get(filepath) != entry.stat().st_mtime:
+                            try:
+                                self.update(filepath)
+                                n_updated += 1
+                            except OSError as err:
+                                # e.g. a file still being written without SWMR
+                                log.warning("Could not index {}: {}".format(filepath, err))
+        with self._connection:
+            self._connection.executemany(
+                "DELETE FROM runs WHERE path = ?", [(path,) for path in known if path not in found])
+        return n_updated
+
+    def _row_to_dict(self, row) -> dict:
+        run = dict(row)
+        run["params"] = json.loads(run["params"] or "{}")
+        run["fit"] = json.loads(run["fit"] or "{}")
+        return run
+
+    def latest(self, measurement: str) -> dict:
+        """
+        Return:
+            the most recent run of the given measurement type as a dict, None if there is none
+        """
+        row = self._connection.execute(
+            "SELECT * FROM runs WHERE measurement = ? ORDER BY timestamp DESC LIMIT 1",
+            (measurement,)).fetchone()
+        return None if row is None else self._row_to_dict(row)
+
+    def between(self, start = None, stop = None, measurement: str = None) -> list:
+        """
+        Return:
+            runs with start <= timestamp < stop (epoch seconds, datetime or
+            time.struct_time, open ended if None), oldest first
+        """
+        query, args = "SELECT * FROM runs WHERE 1", []
+        if start is not None:
+            query += " AND timestamp >= ?"
+            args.append(_to_epoch(start))
+        if stop is not None:
+            query += " AND timestamp < ?"
+            args.append(_to_epoch(stop))
+        if measurement is not None:
+            query += " AND measurement = ?"
+            args.append(measurement)
+        rows = self._connection.execute(query + " ORDER BY timestamp", args).fetchall()
+        return [self._row_to_dict(row) for row in rows]
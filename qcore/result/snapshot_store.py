@@ -0,0 +1,123 @@
+"""
+Module for content-addressed storage of stage / instrument parameter snapshots.
+
+Consecutive runs usually save the same snapshot. A SnapshotStore hashes the
+canonicalised snapshot dict and writes it only once, to "<hash>.hdf5" in a
+shared snapshot directory. The run file only gets an hdf5 external link to it,
+whose target path holds the hash, so "read_dict_from_hdf5" on the run file
+still returns the expanded snapshot. The snapshot directory holds a
+NO_RUNS_MARKER file, so RunCatalog.rescan does not take snapshots for runs.
+"""
+import hashlib
+import os
+import tempfile
+import h5py
+import numpy as np
+from uncertainties import UFloat
+
+from result.hdf5_register import write_dict_to_hdf5
+from result.run_catalog import NO_RUNS_MARKER
+
+SNAPSHOT_DIRNAME = "snapshots"
+
+def _update_hash(hasher, item):
+    """
+    Feeds a canonical byte representation of item into hasher. Dict items are
+    sorted by key, so the hash does not depend on insertion order.
+    """
+    if isinstance(item, dict):
+        hasher.update(b"dict{")
+        for key in sorted(item, key=repr):
+            hasher.update(repr(key).encode("utf-8") + b":")
+            _update_hash(hasher, item[key])
+        hasher.update(b"}")
+    elif isinstance(item, (list, tuple)):
+        hasher.update(type(item).__name__.encode("utf-8") + b"[")
+        for entry in item:
+            _update_hash(hasher, entry)
+        hasher.update(b"]")
+    elif isinstance(item, np.ndarray):
+        hasher.update("ndarray{}{}".format(item.dtype.str, item.shape).encode("utf-8"))
+        if item.dtype.hasobject:
+            for entry in item.flat:
+                _update_hash(hasher, entry)
+        else:
+            hasher.update(np.ascontiguousarray(item).tobytes())
+    elif isinstance(item, UFloat):
+        hasher.update("ufloat{!r},{!r}".format(item.nominal_value, item.std_dev).encode("utf-8"))
+    else:
+        hasher.update("{}:{!r}".format(type(item).__name__, item).encode("utf-8"))
+
+def snapshot_hash(snapshot: dict) -> str:
+    """
+    Return:
+        sha256 hex digest of the canonicalised snapshot
+    """
+    hasher = hashlib.sha256()
+    _update_hash(hasher, snapshot)
+    return hasher.hexdigest()
+
+class SnapshotStore(object):
+    """
+    Directory of snapshots stored once per content hash.
+    """
+    def __init__(self, datadir: str, dirname: str = SNAPSHOT_DIRNAME):
+        """
+        Arguments:
+            datadir (str) : base data directory, the snapshots go to datadir/dirname
+            dirname (str) : name of the snapshot directory
+        """
+        self.path = os.path.join(os.path.abspath(datadir), dirname)
+        os.makedirs(self.path, exist_ok=True)
+        marker = os.path.join(self.path, NO_RUNS_MARKER)
+        if not os.path.exists(marker):
+            open(marker, "a").close()
+
+    def filepath(self, digest: str) -> str:
+        return os.path.join(self.path, digest + ".hdf5")
+
+    def store(self, snapshot: dict) -> str:
+        """
+        Writes the snapshot unless a snapshot with the same content is already stored.
+
+        Return:
+            the hash of the snapshot
+        """
+        digest = snapshot_hash(snapshot)
+        filepath = self.filepath(digest)
+        if not os.path.exists(filepath):
+            # written to a temporary file and renamed, so that concurrent writers
+            # of the same snapshot never leave a partial file behind
+            fd, tmp_path = tempfile.mkstemp(suffix=".tmp", dir=self.path)
+            os.close(fd)
+            try:
+                with h5py.File(tmp_path, "w") as f:
+                    write_dict_to_hdf5(snapshot, f)
+                os.replace(tmp_path, filepath)
+            except BaseException:
+                os.remove(tmp_path)
+                raise
+        return digest
+
+    def write(self, snapshot: dict, entry_point, key: str = "snapshot") -> str:
+        """
+        Stores the snapshot and links it as "key" in entry_point (an hdf5 file or group).
+        The link is relative to the run file, so the data directory can be moved as a whole.
+
+        Return:
+            the hash of the snapshot
+        """
+        digest = self.store(snapshot)
+        run_folder = os.path.dirname(os.path.abspath(entry_point.file.filename))
+        entry_point[key] = h5py.ExternalLink(os.path.relpath(self.filepath(digest), run_folder), "/")
+        return digest
+
+def linked_snapshot_hash(entry_point, key: str = "snapshot") -> str:
+    """
+    Return:
+        the hash of the snapshot linked as "key" in entry_point, None if "key" is not such a link
+    """
+    link = entry_point.get(key, getlink=True)
+    if not isinstance(link, h5py.ExternalLink):
+        return None
+    return os.path.splitext(os.path.basename(link.filename))[0]